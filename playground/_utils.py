@@ -1,4 +1,15 @@
+import contextlib
 import hashlib
+import math
+import os
+import sys
+
+from PIL import Image, ImageOps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 
 def get_hash(string):
@@ -7,3 +18,105 @@ def get_hash(string):
 
 def get_md5(string):
     return hashlib.md5(string.encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def pixel_limit(max_pixels):
+    """只在这一次 Image.open 里把 Pillow 的解压炸弹上限放宽到 max_pixels，之后恢复"""
+    old = Image.MAX_IMAGE_PIXELS
+    if max_pixels and old and max_pixels > old:
+        Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        yield
+    finally:
+        Image.MAX_IMAGE_PIXELS = old
+
+
+def decoded_size(im, request=None):
+    """解码后的尺寸：JPEG 的 draft(None, request) 按 1/2、1/4、1/8 缩小（与 Pillow 的选法相同）"""
+    w, h = im.size
+    if im.format != "JPEG" or not request:
+        return w, h
+    fit = min(w // request[0], h // request[1])
+    scale = next(s for s in (8, 4, 2, 1) if fit >= s)
+    return math.ceil(w / scale), math.ceil(h / scale)
+
+
+def open_image(path, max_size=None, max_pixels=None, fit=False):
+    """
+    打开图片并按 EXIF 方向摆正
+    max_size 为最长边上限：JPEG 先用 draft() 在解码时按 1/2、1/4、1/8 缩小，再精确缩放到 max_size 以内
+    max_pixels 为解码像素数上限（见 budget_pixels），只读文件头就检查，超出时抛 ValueError，
+    不会悄悄降低分辨率；fit 为 True 时才缩小到上限以内（JPEG 在解码时缩小，其他格式先完整解码）
+    """
+    with pixel_limit(max_pixels):
+        im = Image.open(path)
+    w, h = im.size
+    request = None
+    if max_size and max(im.size) > max_size:
+        # 选不小于目标尺寸的最大缩小比例，解码时间和内存随之下降
+        ratio = max_size / max(im.size)
+        request = (math.ceil(w * ratio), math.ceil(h * ratio))
+    pixels = math.prod(decoded_size(im, request))
+    if max_pixels and pixels > max_pixels:
+        if not fit:
+            im.close()
+            raise ValueError(
+                f"{path}: {w}x{h} needs about {pixels * 4 // 2**20}MB to decode, "
+                f"over the {max_pixels * 4 // 2**20}MB budget"
+            )
+        # 预算是硬上限：选能放进预算的最小缩小比例
+        scale = 1
+        while scale < 8 and w * h > max_pixels * scale * scale:
+            scale *= 2
+        budget = (math.ceil(w / scale), math.ceil(h / scale))
+        request = min(request, budget) if request else budget
+        limit = max(1, int(max(im.size) * math.sqrt(max_pixels / (w * h))))
+        max_size = min(max_size, limit) if max_size else limit
+    if request:
+        # 只对 JPEG 生效
+        im.draft(None, request)
+    # 原地转正，没有方向标记时不会复制整帧
+    ImageOps.exif_transpose(im, in_place=True)
+    if max_size and max(im.size) > max_size:
+        im.thumbnail((max_size, max_size), Image.LANCZOS)
+    return im
+
+
+def iter_files(root, out_root, exts):
+    """
+    递归遍历 root，生成 (文件路径, 对应的输出目录)，exts 为小写后缀元组
+    输出目录按需创建且只创建一次；输出目录在 root 里面时跳过它
+    """
+    out_abs = os.path.abspath(out_root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [
+            d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) != out_abs
+        ]
+        out_dir = os.path.join(out_root, os.path.relpath(dirpath, root))
+        made = False
+        for name in sorted(filenames):
+            if name.lower().endswith(exts):
+                if not made:
+                    os.makedirs(out_dir, exist_ok=True)
+                    made = True
+                yield os.path.join(dirpath, name), out_dir
+
+
+def budget_pixels(memory_mb):
+    """内存预算（MB）内可以解码的像素数，按每像素 4 字节（RGBA）估算"""
+    if not memory_mb:
+        return None
+    return memory_mb * 2**20 // 4
+
+
+def peak_rss_mb():
+    """本进程与已回收子进程中最大的峰值 RSS，单位 MB；没有 resource 模块时返回 nan"""
+    if resource is None:
+        return float("nan")
+    rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Linux 上单位是 KB，macOS 上是字节
+    return rss / (2**20 if sys.platform == "darwin" else 2**10)
@@ -2,31 +2,175 @@
 __author__ = "genffy"
 """
 将某个文件下的所有文件拷贝到指定的文件夹下。（之前由于歌曲存放是按专辑名歌手名 建文件夹的，不想手动的Ctr+C和Ctr+V）
+
+    python copy-file.py path/to/source path/to/target --ext .mp3,.flac -j 8 --on-collision rename
+
+- 按块拷贝，Linux 上优先 os.copy_file_range（内核内拷贝，不经过用户态缓冲），不会把整个文件读进内存
+- 有界线程池并行，在途任务数有上限，十万个文件也不会一次提交十万个 future
+- 目标已存在且大小和修改时间都相同时跳过，重复运行只拷贝新文件
+- 重名处理：skip 保留已有文件，overwrite 覆盖，rename 追加 -1、-2 ...
+- 先写 .part 临时文件再改名，中途被杀掉不会留下半个文件
 """
+import argparse
 import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_EXTS = {".jpg", ".png", ".jpeg", ".gif", ".mp4", ".mp3"}
+CHUNK_SIZE = 1024 * 1024
+POLICIES = ("skip", "overwrite", "rename")
+
+
+def same_file(st, target):
+    """目标与源的大小、修改时间一致，视为已经拷贝过"""
+    try:
+        tst = os.stat(target)
+    except FileNotFoundError:
+        return False
+    return tst.st_size == st.st_size and tst.st_mtime_ns == st.st_mtime_ns
+
+
+def copy_file(source_file, target_file, chunk_size=CHUNK_SIZE):
+    """拷贝一个文件并保留修改时间，返回字节数"""
+    st = os.stat(source_file)
+    tmp = target_file + ".part"
+    with open(source_file, "rb") as fsrc, open(tmp, "wb") as fdst:
+        copied = False
+        if hasattr(os, "copy_file_range"):
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+                copied = True
+            except OSError:
+                # 跨文件系统或内核不支持，退回按块读写
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        if not copied:
+            shutil.copyfileobj(fsrc, fdst, chunk_size)
+    os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp, target_file)
+    return st.st_size
+
+
+def plan_target(st, target_dir, name, policy, claimed):
+    """
+    返回 (目标路径, 状态)，状态为 copy / unchanged / collision
+    claimed 为本次运行已经分配出去的目标，同名的第二个源文件不会和第一个抢同一个目标
+    """
+    target = os.path.join(target_dir, name)
+    if policy != "rename":
+        if target in claimed:
+            return target, "collision"
+        if same_file(st, target):
+            return target, "unchanged"
+        if policy == "skip" and os.path.exists(target):
+            return target, "collision"
+        return target, "copy"
+
+    stem, ext = os.path.splitext(name)
+    seq = 0
+    while True:
+        if target not in claimed:
+            if same_file(st, target):
+                return target, "unchanged"
+            if not os.path.exists(target):
+                return target, "copy"
+        seq += 1
+        target = os.path.join(target_dir, f"{stem}-{seq}{ext}")
+
 
+def find_file(
+    root_dir,
+    target_dir,
+    ext_arr=None,
+    jobs=4,
+    policy="skip",
+    chunk_size=CHUNK_SIZE,
+    verbose=False,
+):
+    exts = {e.lower() for e in (ext_arr or DEFAULT_EXTS)}
+    os.makedirs(target_dir, exist_ok=True)
+    target_abs = os.path.abspath(target_dir)
+    claimed = set()
+    stats = dict.fromkeys(("copy", "unchanged", "collision", "failed"), 0)
+    copied_bytes = 0
+    start = time.perf_counter()
 
-def find_file(root_dir, target_dir, ext_arr=None):
-    if ext_arr is None:
-        ext_arr = [".jpg", ".png", ".jpeg", ".gif", ".mp4", ".mp3"]
-    list_dirs = os.walk(root_dir)
-    for root, dirs, files in list_dirs:
-        # for d in dirs:
-        #     print(os.path.join(root, d))
-        for f in files:
-            ext = os.path.splitext(f)[1]  # 获取后缀名
-            if ext in ext_arr:
-                print(ext)
-                this_file = os.path.join(root, f)
-                target_file = os.path.join(target_dir, f)
-                copy_file(this_file, target_file)
-                print(os.path.join(root, f))
+    def done(future, source):
+        nonlocal copied_bytes
+        try:
+            copied_bytes += future.result()
+            stats["copy"] += 1
+            if verbose:
+                print("copy success " + source)
+        except OSError as e:
+            stats["failed"] += 1
+            print(f"copy failed {source}: {e}")
 
+    with ThreadPoolExecutor(jobs) as pool:
+        pending = {}
+        for root, dirs, files in os.walk(root_dir):
+            dirs[:] = sorted(
+                d for d in dirs if os.path.abspath(os.path.join(root, d)) != target_abs
+            )
+            for f in sorted(files):
+                if os.path.splitext(f)[1].lower() not in exts:  # 获取后缀名
+                    continue
+                source = os.path.join(root, f)
+                st = os.stat(source)
+                target, state = plan_target(st, target_dir, f, policy, claimed)
+                claimed.add(target)
+                if state != "copy":
+                    stats[state] += 1
+                    if verbose or state == "collision":
+                        print(f"{state}: {source} -> {target}")
+                    continue
+                pending[pool.submit(copy_file, source, target, chunk_size)] = source
+                # 在途任务有上限，遍历不会跑到拷贝前面太远
+                if len(pending) >= jobs * 4:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        done(future, pending.pop(future))
+        for future in list(pending):
+            done(future, pending.pop(future))
 
-def copy_file(source_file, target_file):
-    open(target_file, "wb").write(open(source_file, "rb").read())
-    print("copy success" + source_file)
+    cost = time.perf_counter() - start
+    print(
+        f"copied {stats['copy']} files ({copied_bytes / 2 ** 20:.1f}MB) in {cost:.2f}s, "
+        f"{copied_bytes / 2 ** 20 / cost if cost else 0:.1f}MB/s; "
+        f"unchanged {stats['unchanged']}, collisions {stats['collision']}, "
+        f"failed {stats['failed']}"
+    )
+    return stats
 
 
 if __name__ == "__main__":
-    find_file("path/to/source", "path/to/target")
+    parser = argparse.ArgumentParser(description="copy matching files into one folder")
+    parser.add_argument("source", nargs="?", default="path/to/source")
+    parser.add_argument("target", nargs="?", default="path/to/target")
+    parser.add_argument(
+        "--ext",
+        default=",".join(sorted(DEFAULT_EXTS)),
+        help="comma separated extensions, e.g. .mp3,.flac",
+    )
+    parser.add_argument("-j", "--jobs", default=4, type=int, help="copy threads")
+    parser.add_argument(
+        "--on-collision",
+        default="skip",
+        choices=POLICIES,
+        help="when a different file with the same name is already in target",
+    )
+    parser.add_argument("--chunk-size", default=CHUNK_SIZE, type=int)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    find_file(
+        args.source,
+        args.target,
+        [e.strip() for e in args.ext.split(",") if e.strip()],
+        args.jobs,
+        args.on_collision,
+        args.chunk_size,
+        args.verbose,
+    )
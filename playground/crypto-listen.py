@@ -9,12 +9,42 @@ import websocket
 import json
 import threading
 
+import requests
+
+from orderbook import OrderBook
+from tickstore import TickRecorder
+
+SNAPSHOT_URL = "https://api.binance.us/api/v3/depth?symbol=%s&limit=1000"
+book = OrderBook("BNBBTC")
+CAPTURE = None  # 例如 "./data/bnbbtc@depth.jsonl"，录下增量供 orderbook.py 离线回放
+RECORD_ROOT = None  # 例如 "./data/ticks"，kline / depth 按小时压缩存盘，见 tickstore.py
+recorder = None
+
+
+def load_snapshot():
+    # 先订阅再拉快照，期间收到的增量由 OrderBook 缓存
+    snapshot = requests.get(SNAPSHOT_URL % book.symbol).json()
+    if CAPTURE:
+        with open(CAPTURE + ".snapshot.json", "w") as f:
+            json.dump(snapshot, f)
+    book.load_snapshot(snapshot)
+
 
 def on_message(_, message):
     # 处理接收到的消息
     msg = json.loads(message)
+    if recorder:
+        recorder.record(msg)
     if msg["e"] == "kline":
         print(msg)
+    elif msg["e"] == "depthUpdate":
+        if CAPTURE:
+            with open(CAPTURE, "a") as f:
+                f.write(message + "\n")
+        if book.apply(msg):
+            print(book.best_bid(), book.best_ask(), book.latency.summary())
+        elif not book.synced:
+            load_snapshot()
 
 
 def on_error(_, error):
@@ -33,6 +63,7 @@ def on_open(ws_ins):
     # 发送订阅消息
     subscribe_msg = {"method": "SUBSCRIBE", "params": ["btcusdt@kline_1m"], "id": 1}
     ws_ins.send(json.dumps(subscribe_msg))
+    load_snapshot()
 
 
 if __name__ == "__main__":
@@ -46,6 +77,8 @@ if __name__ == "__main__":
         on_close=on_close,
     )
     ws.on_open = on_open
+    if RECORD_ROOT:
+        recorder = TickRecorder(RECORD_ROOT)
 
     # 启动WebSocket线程
     ws_thread = threading.Thread(target=ws.run_forever)
@@ -53,3 +86,5 @@ if __name__ == "__main__":
 
     # 等待WebSocket线程结束
     ws_thread.join()
+    if recorder:
+        recorder.close()
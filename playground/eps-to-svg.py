@@ -1,6 +1,109 @@
+import contextlib
+import functools
+import hashlib
+import io
+import json
 import subprocess
 import os
 import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from media_jobs import Job, JobRunner
+
+# Inkscape export actions per quality, shared by the command line and --shell batch mode
+QUALITY_ACTIONS = {
+    "high": ["export-text-to-path", "export-area-drawing", "export-dpi:300"],
+    "default": [],
+}
+# Input hashes of converted files, kept in the output directory
+MANIFEST = ".eps-to-svg.json"
+
+
+@functools.lru_cache(maxsize=None)
+def find_tools():
+    """
+    Looks up Ghostscript, Inkscape and dvisvgm (optional, see eps_to_svg_direct)
+    once per process.
+
+    Returns:
+        dict with "gs", "inkscape" and "dvisvgm" paths, None for a missing tool.
+    """
+    gs = shutil.which("gs") or shutil.which("gswin64c") or shutil.which("gswin32c")
+    return {
+        "gs": gs,
+        "inkscape": shutil.which("inkscape"),
+        "dvisvgm": shutil.which("dvisvgm"),
+    }
+
+
+def gs_command(gs, eps_path, pdf_path):
+    return [
+        gs,
+        "-dNOPAUSE",
+        "-dBATCH",
+        "-dEPSCrop",  # Crop to the EPS bounding box
+        "-dPDFSETTINGS=/prepress",  # Highest quality PDF output
+        "-dCompatibilityLevel=1.7",  # Use latest PDF compatibility
+        "-dAutoRotatePages=/None",  # Don't rotate pages
+        "-dDetectDuplicateImages=true",  # Optimize output
+        "-sDEVICE=pdfwrite",
+        f"-sOutputFile={pdf_path}",
+        eps_path,
+    ]
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def is_up_to_date(eps_path, svg_path, entry, options):
+    """
+    make-style check: the SVG is at least as new as the EPS, or the EPS content still
+    hashes to what was stored when the SVG was made (e.g. after a checkout touched it).
+    In the hash case the SVG mtime is bumped so the next run takes the cheap path.
+    `options` are the conversion settings (quality, converter); an SVG made with other
+    settings is stale either way. Without a manifest entry only the mtimes are compared.
+    """
+    if not os.path.exists(svg_path):
+        return False
+    if entry and any(entry.get(key) != value for key, value in options.items()):
+        return False
+    if os.path.getmtime(svg_path) >= os.path.getmtime(eps_path):
+        return True
+    if entry and entry.get("sha256") == file_sha256(eps_path):
+        os.utime(svg_path)
+        return True
+    return False
+
+
+def tmpfs_dir():
+    """/dev/shm when it is available, so temp PDFs never touch the disk."""
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return shm
+    return None
+
 
 def eps_to_svg_inkscape(eps_path, svg_path, quality="high"):
     """
@@ -15,11 +118,12 @@ def eps_to_svg_inkscape(eps_path, svg_path, quality="high"):
     Returns:
         True on success, False on failure.
     """
-    if not shutil.which("inkscape"):
+    tools = find_tools()
+    if not tools["inkscape"]:
         print("ERROR: Inkscape command not found. Please install Inkscape and ensure it's in your PATH.")
         return False
         
-    if not shutil.which("gs"):
+    if not tools["gs"]:
         print("ERROR: Ghostscript (gs) command not found. Please install Ghostscript and ensure it's in your PATH.")
         return False
 
@@ -30,19 +134,7 @@ def eps_to_svg_inkscape(eps_path, svg_path, quality="high"):
     try:
         # Step 1: Convert EPS to PDF using Ghostscript with improved quality
         temp_pdf = eps_path + ".temp.pdf"
-        gs_cmd = [
-            "gs", 
-            "-dNOPAUSE", 
-            "-dBATCH", 
-            "-dEPSCrop",  # Crop to the EPS bounding box
-            "-dPDFSETTINGS=/prepress",  # Highest quality PDF output
-            "-dCompatibilityLevel=1.7",  # Use latest PDF compatibility
-            "-dAutoRotatePages=/None",  # Don't rotate pages
-            "-dDetectDuplicateImages=true",  # Optimize output
-            "-sDEVICE=pdfwrite", 
-            f"-sOutputFile={temp_pdf}", 
-            eps_path
-        ]
+        gs_cmd = gs_command(tools["gs"], eps_path, temp_pdf)
         
         print(f"Running command: {' '.join(gs_cmd)}")
         gs_result = subprocess.run(gs_cmd, capture_output=True, text=True, check=False)
@@ -59,7 +151,7 @@ def eps_to_svg_inkscape(eps_path, svg_path, quality="high"):
         
         # Step 2: Convert PDF to SVG using Inkscape with improved quality
         inkscape_cmd = [
-            "inkscape",
+            tools["inkscape"],
             temp_pdf,
             f"--export-filename={svg_path}",
         ]
@@ -101,15 +193,219 @@ def eps_to_svg_inkscape(eps_path, svg_path, quality="high"):
         print(f"An unexpected error occurred: {e}")
         return False
 
-def batch_convert_eps_to_svg(input_dir, output_dir, quality="high"):
+def eps_to_svg_direct(eps_path, svg_path, quality="high", timeout=None):
+    """
+    Converts an EPS file to SVG without an intermediate PDF on disk.
+    Uses dvisvgm --eps when it is installed (a single process); otherwise Ghostscript
+    writes the PDF to stdout and Inkscape reads it from stdin (--pipe).
+
+    Args:
+        eps_path: Path to input EPS file
+        svg_path: Path to output SVG file
+        quality: "high" or "default" - determines conversion parameters
+        timeout: seconds before the conversion is killed
+
+    Returns:
+        True on success, False on failure.
+    """
+    tools = find_tools()
+    if not os.path.exists(eps_path):
+        print(f"ERROR: Input EPS file not found: {eps_path}")
+        return False
+
+    if tools["dvisvgm"]:
+        cmd = [tools["dvisvgm"], "--eps", "--exact-bbox", f"--output={svg_path}", eps_path]
+        if quality == "high":
+            cmd.insert(2, "--no-fonts")  # glyphs as paths, like --export-text-to-path
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"ERROR: dvisvgm timed out for '{eps_path}'.")
+            return False
+        if result.returncode != 0 or not os.path.exists(svg_path):
+            print(f"ERROR: dvisvgm conversion failed for '{eps_path}'.")
+            print("STDERR:", result.stderr)
+            return False
+        return True
+
+    if not tools["gs"] or not tools["inkscape"]:
+        print("ERROR: Neither dvisvgm nor Ghostscript + Inkscape found in your PATH.")
+        return False
+
+    # stdout carries the PDF, so Ghostscript's own messages go to stderr
+    gs_cmd = gs_command(tools["gs"], eps_path, "-")
+    gs_cmd[1:1] = ["-q", "-sstdout=%stderr"]
+    inkscape_cmd = [
+        tools["inkscape"],
+        "--pipe",
+        "--export-type=svg",
+        f"--export-filename={svg_path}",
+    ] + ["--" + action.replace(":", "=") for action in QUALITY_ACTIONS[quality]]
+    with tempfile.TemporaryFile() as gs_err:
+        gs = subprocess.Popen(gs_cmd, stdout=subprocess.PIPE, stderr=gs_err)
+        inkscape = subprocess.Popen(
+            inkscape_cmd,
+            stdin=gs.stdout,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        gs.stdout.close()  # Ghostscript gets SIGPIPE if Inkscape exits early
+        try:
+            _, inkscape_err = inkscape.communicate(timeout=timeout)
+            gs.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            gs.kill()
+            inkscape.kill()
+            gs.wait()
+            inkscape.wait()
+            print(f"ERROR: conversion timed out for '{eps_path}'.")
+            return False
+        if gs.returncode != 0 or inkscape.returncode != 0 or not os.path.exists(svg_path):
+            gs_err.seek(0)
+            print(f"ERROR: Ghostscript | Inkscape pipe failed for '{eps_path}'.")
+            print("Ghostscript:", gs.returncode, gs_err.read().decode(errors="replace"))
+            print("Inkscape:", inkscape.returncode, inkscape_err)
+            return False
+    return True
+
+
+def benchmark(input_dir, quality="high", files=10):
+    """
+    Per-file latency of the two-step path (eps_to_svg_inkscape, temp PDF on disk)
+    against the direct path (eps_to_svg_direct) on the first `files` EPS files.
+    """
+    eps_files = sorted(
+        os.path.join(root, file)
+        for root, _, names in os.walk(input_dir)
+        for file in names
+        if file.lower().endswith('.eps')
+    )[:files]
+    if not eps_files:
+        print(f"No EPS files in {input_dir}")
+        return
+    direct = "dvisvgm" if find_tools()["dvisvgm"] else "gs | inkscape --pipe"
+    methods = {"two-step": eps_to_svg_inkscape, f"direct ({direct})": eps_to_svg_direct}
+    with tempfile.TemporaryDirectory() as out:
+        for name, convert in methods.items():
+            times, ok = [], 0
+            for i, eps in enumerate(eps_files):
+                svg = os.path.join(out, f"{i}.svg")
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ok += convert(eps, svg, quality)
+                times.append(time.perf_counter() - start)
+                if os.path.exists(svg):
+                    os.remove(svg)
+            times.sort()
+            print(f"{name}: {ok}/{len(times)} ok, per file "
+                  f"mean {sum(times) / len(times) * 1000:.0f}ms, "
+                  f"median {times[len(times) // 2] * 1000:.0f}ms, "
+                  f"max {times[-1] * 1000:.0f}ms")
+
+
+def inkscape_shell(inkscape, pairs, quality="high", timeout=None):
+    """
+    Converts many PDFs with one Inkscape process in --shell mode (Inkscape 1.2+):
+    one "file-open; export-...; export-do; file-close" action line per file on stdin.
+
+    Args:
+        pairs: [(pdf_path, svg_path)]
+
+    Returns:
+        (returncode, stderr); None as returncode when the process timed out.
+    """
+    options = "".join(f"{action}; " for action in QUALITY_ACTIONS[quality])
+    script = "".join(
+        f"file-open:{pdf}; export-filename:{svg}; {options}export-do; file-close\n"
+        for pdf, svg in pairs
+    )
+    proc = subprocess.Popen(
+        [inkscape, "--shell"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        _, err = proc.communicate(script + "quit\n", timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        return None, f"timed out after {timeout}s"
+    return proc.returncode, err
+
+
+def _stale(pdf, svg):
+    """SVG missing, or older than the PDF it should have been exported from"""
+    return not os.path.exists(svg) or os.path.getmtime(svg) < os.path.getmtime(pdf)
+
+
+def _run_shells(inkscape, chunks, quality, jobs, timeout):
+    with ThreadPoolExecutor(min(jobs, len(chunks)) or 1) as pool:
+        for code, err in pool.map(
+            lambda chunk: inkscape_shell(inkscape, chunk, quality, timeout), chunks
+        ):
+            if code != 0:
+                print(f"ERROR: Inkscape batch failed ({code}): {err.strip()[-500:]}")
+
+
+def _convert_two_step(pairs, tools, quality, jobs, timeout, workdir):
+    """gs -> temp PDFs in the workdir -> Inkscape --shell batches"""
+    with tempfile.TemporaryDirectory(prefix="eps-to-svg-", dir=workdir or tmpfs_dir()) as work:
+        # Step 1: EPS -> PDF, one Ghostscript process per file, `jobs` at a time
+        pdfs = [os.path.join(work, f"{i}.pdf") for i in range(len(pairs))]
+        runner = JobRunner(jobs, timeout=timeout, verbose=False)
+        runner.run(
+            Job(gs_command(tools["gs"], eps, pdf), outputs=[pdf], inputs=[eps], name=eps)
+            for (eps, _), pdf in zip(pairs, pdfs)
+        )
+        ready = [(pdf, svg) for pdf, (_, svg) in zip(pdfs, pairs) if os.path.exists(pdf)]
+
+        # Step 2: PDF -> SVG, the PDFs dealt round-robin to `jobs` Inkscape shells
+        _run_shells(tools["inkscape"], [ready[i::jobs] for i in range(min(jobs, len(ready)))],
+                    quality, jobs, timeout)
+        # A crash or timeout loses the rest of that shell's share, so retry whatever
+        # is missing one file per shell: a bad PDF then only fails itself
+        left = [(pdf, svg) for pdf, svg in ready if _stale(pdf, svg)]
+        if left:
+            print(f"Retrying {len(left)} files one per Inkscape shell")
+            _run_shells(tools["inkscape"], [[pair] for pair in left], quality, jobs, timeout)
+
+
+def batch_convert_eps_to_svg(
+    input_dir,
+    output_dir,
+    quality="high",
+    jobs=None,
+    timeout=None,
+    workdir=None,
+    force=False,
+    direct=False,
+):
     """
     Batch converts all EPS files in the input directory to SVG files in the output directory.
     Preserves the directory structure.
+
+    Ghostscript runs as `jobs` parallel processes (media_jobs.JobRunner) writing the
+    temporary PDFs into a tmpfs workdir; then `jobs` Inkscape --shell processes each
+    convert a share of the PDFs, so Inkscape starts `jobs` times instead of once per file.
+
+    With `direct`, each file goes through eps_to_svg_direct instead, `jobs` at a time,
+    and no temporary PDFs are written at all.
+
+    Files whose SVG is up to date (see is_up_to_date) are skipped unless `force` is set;
+    input hashes of converted files are stored in MANIFEST in the output directory.
     
     Args:
         input_dir: The directory containing EPS files
         output_dir: The directory to save converted SVG files
         quality: "high" or "default" - quality settings for conversion
+        jobs: number of parallel processes, defaults to the CPU count
+        timeout: seconds per Ghostscript run and per Inkscape batch
+        workdir: where the temporary PDFs go, defaults to /dev/shm when available
+        force: convert every file, even when its SVG is up to date
+        direct: use eps_to_svg_direct (no temporary PDFs)
     
     Returns:
         tuple: (total_files, success_count, failed_files)
@@ -117,42 +413,63 @@ def batch_convert_eps_to_svg(input_dir, output_dir, quality="high"):
     if not os.path.exists(input_dir):
         print(f"ERROR: Input directory not found: {input_dir}")
         return 0, 0, []
-    
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    total_files = 0
-    success_count = 0
-    failed_files = []
-    
-    # Walk through input directory
-    for root, _, files in os.walk(input_dir):
-        for file in files:
+
+    tools = find_tools()
+    required = ("dvisvgm",) if direct and tools["dvisvgm"] else ("gs", "inkscape")
+    missing = [name for name in required if not tools[name]]
+    if missing:
+        print(f"ERROR: {', '.join(missing)} not found. Please ensure they are in your PATH.")
+        return 0, 0, []
+
+    jobs = jobs or os.cpu_count() or 1
+    pairs = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for file in sorted(files):
             if file.lower().endswith('.eps'):
-                # Get relative path to maintain directory structure
-                rel_path = os.path.relpath(root, input_dir)
-                
-                # Create the output directory structure
-                output_subdir = os.path.join(output_dir, rel_path)
-                if not os.path.exists(output_subdir):
-                    os.makedirs(output_subdir)
-                
-                # Prepare input and output paths
-                eps_path = os.path.join(root, file)
+                # Keep the directory structure in the output
+                output_subdir = os.path.join(output_dir, os.path.relpath(root, input_dir))
+                os.makedirs(output_subdir, exist_ok=True)
                 svg_filename = os.path.splitext(file)[0] + '.svg'
-                svg_path = os.path.join(output_subdir, svg_filename)
-                
-                print(f"Converting {eps_path} to {svg_path}")
-                total_files += 1
-                
-                # Perform the conversion
-                if eps_to_svg_inkscape(eps_path, svg_path, quality):
-                    success_count += 1
-                else:
-                    failed_files.append(eps_path)
-    
-    return total_files, success_count, failed_files
+                pairs.append((os.path.join(root, file), os.path.join(output_subdir, svg_filename)))
+    if not pairs:
+        return 0, 0, []
+
+    manifest = load_manifest(output_dir)
+    # settings that change the SVG, stored with each hash
+    options = {
+        "quality": quality,
+        "converter": "dvisvgm" if direct and tools["dvisvgm"] else "inkscape",
+    }
+    total = len(pairs)
+    if not force:
+        pairs = [
+            (eps, svg) for eps, svg in pairs
+            if not is_up_to_date(eps, svg, manifest.get(os.path.relpath(eps, input_dir)), options)
+        ]
+        if len(pairs) < total:
+            print(f"{total - len(pairs)} files up to date, {len(pairs)} to convert")
+    if not pairs:
+        return total, total, []
+
+    start = time.time()
+    if direct:
+        with ThreadPoolExecutor(jobs) as pool:
+            list(pool.map(lambda pair: eps_to_svg_direct(*pair, quality, timeout), pairs))
+    else:
+        _convert_two_step(pairs, tools, quality, jobs, timeout, workdir)
+
+    failed_files = []
+    for eps, svg in pairs:
+        if not os.path.exists(svg) or os.path.getmtime(svg) < start:
+            failed_files.append(eps)
+        else:
+            manifest[os.path.relpath(eps, input_dir)] = {"sha256": file_sha256(eps), **options}
+    save_manifest(output_dir, manifest)
+    cost = time.time() - start
+    print(f"Converted {len(pairs) - len(failed_files)}/{len(pairs)} files in {cost:.2f}s "
+          f"({len(pairs) / cost if cost else 0:.2f} files/s, {jobs} jobs)")
+    return total, total - len(failed_files), failed_files
 
 if __name__ == "__main__":
     import argparse
@@ -162,17 +479,35 @@ if __name__ == "__main__":
     parser.add_argument('--output', default='output', help='Output directory for SVG files')
     parser.add_argument('--quality', choices=['high', 'default'], default='high',
                         help='Quality settings for conversion')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Parallel Ghostscript / Inkscape processes, defaults to the CPU count')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Seconds per Ghostscript run and per Inkscape batch')
+    parser.add_argument('--workdir', default=None,
+                        help='Directory for temporary PDFs, defaults to /dev/shm when available')
+    parser.add_argument('--force', action='store_true',
+                        help='Reconvert every file, even when its SVG is up to date')
+    parser.add_argument('--direct', action='store_true',
+                        help='Convert without temporary PDFs (dvisvgm, or gs piped into inkscape)')
+    parser.add_argument('--bench', type=int, default=0, metavar='N',
+                        help='Time the two-step and direct paths on the first N files, convert nothing')
     
     args = parser.parse_args()
     
     input_dir = args.input
     output_dir = args.output
     quality = args.quality
+
+    if args.bench:
+        benchmark(input_dir, quality, args.bench)
+        raise SystemExit
     
     print(f"Starting batch conversion from '{input_dir}' to '{output_dir}'")
-    print(f"Using two-step conversion method with {quality} quality settings")
+    print(f"Using {'direct' if args.direct else 'two-step'} conversion method with {quality} quality settings")
     
-    total, successful, failed = batch_convert_eps_to_svg(input_dir, output_dir, quality)
+    total, successful, failed = batch_convert_eps_to_svg(
+        input_dir, output_dir, quality, args.jobs, args.timeout, args.workdir, args.force,
+        args.direct)
     
     print("\nConversion Summary:")
     print(f"Total EPS files found: {total}")
@@ -1,17 +1,191 @@
-import moviepy.editor as mp
+"""
+从视频中提取音轨：先探测音频编码，目标容器支持时直接 -c:a copy（不解码不重编码），否则转成 mp3
 
+    python extract-audio.py ./data -o ./output -j 4
+    python extract-audio.py ./data/download-0.mp4 --reencode   # 总是输出 mp3
 
-def extract_audio(videos_file_path):
-    my_clip = mp.VideoFileClip(videos_file_path)
-    my_clip.audio.write_audiofile("./output/{get_md5(videos_file_path)}.mp3")
+输出文件名为视频路径的 md5（_utils.get_md5），后缀随音频编码而定
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from _utils import get_md5
+from media_jobs import Job, JobLog, JobRunner
+
+VIDEO_EXTS = (".mp4", ".mkv", ".mov", ".webm", ".flv", ".avi", ".ts", ".m4v")
+# 音频编码 -> 可以原样放进去的容器后缀
+COPY_EXTS = {
+    "aac": ".m4a",
+    "alac": ".m4a",
+    "mp3": ".mp3",
+    "opus": ".opus",
+    "vorbis": ".ogg",
+    "flac": ".flac",
+    "ac3": ".ac3",
+    "eac3": ".eac3",
+    "pcm_s16le": ".wav",
+    "pcm_s24le": ".wav",
+}
+
+
+def find_tools():
+    """ffmpeg 优先用 PATH 里的，没有时用 moviepy 依赖的 imageio-ffmpeg 自带的；ffprobe 可以没有"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        try:
+            import imageio_ffmpeg
+
+            ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+        except (ImportError, RuntimeError):
+            raise SystemExit("ffmpeg not found, install ffmpeg or imageio-ffmpeg")
+    return ffmpeg, shutil.which("ffprobe")
+
+
+def probe_audio(video_path, ffmpeg="ffmpeg", ffprobe=None):
+    """(第一条音轨的编码名, 时长秒)，没有音轨时编码为 None，时长未知时为 None"""
+    if ffprobe:
+        cmd = [
+            ffprobe,
+            "-v",
+            "error",
+            "-select_streams",
+            "a:0",
+            "-show_entries",
+            "stream=codec_name:format=duration",
+            "-of",
+            "json",
+            video_path,
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            info = json.loads(result.stdout)
+        except ValueError:
+            return None, None
+        streams = info.get("streams") or [{}]
+        duration = info.get("format", {}).get("duration")
+        return streams[0].get("codec_name"), float(duration) if duration else None
+    # 没有 ffprobe 时从 ffmpeg -i 的输出里找 "Duration: 00:01:02.34" 和 "Audio: aac ..."
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-i", video_path], capture_output=True, text=True
+    )
+    codec = re.search(r"Stream #\S+.*?: Audio: (\w+)", result.stderr)
+    duration = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr)
+    if duration:
+        h, m, sec = duration.groups()
+        duration = int(h) * 3600 + int(m) * 60 + float(sec)
+    return codec.group(1) if codec else None, duration
+
+
+def audio_key(video_path, reencode=False):
+    """日志里按输入视频（和是否重编码）记录，重新运行时不用探测就能跳过"""
+    return get_md5(f"{os.path.abspath(video_path)}|{'mp3' if reencode else 'auto'}")
+
+
+def audio_job(video_path, out_dir="./output", reencode=False, tools=None):
+    """
+    提取一个视频音轨的 media_jobs.Job：能 stream copy 时先 copy，失败再重编码成 mp3；没有音轨时返回 None
+    """
+    ffmpeg, ffprobe = tools or find_tools()
+    name = get_md5(os.path.abspath(video_path))
+    codec, duration = probe_audio(video_path, ffmpeg, ffprobe)
+    if codec is None and not reencode:
+        return None
+    base = [ffmpeg, "-y", "-v", "error", "-i", video_path, "-vn", "-map", "0:a:0"]
+    mp3 = os.path.join(out_dir, f"{name}.mp3")
+    key = audio_key(video_path, reencode)
+    encode = Job(
+        base + ["-c:a", "libmp3lame", "-q:a", "2", mp3],
+        outputs=[mp3],
+        inputs=[video_path],
+        duration=duration,
+        key=key,
+    )
+    if reencode or codec not in COPY_EXTS:
+        return encode
+    out = os.path.join(out_dir, name + COPY_EXTS[codec])
+    # 个别流（比如 ADTS 头的 aac）放不进目标容器，退回重编码
+    return Job(
+        base + ["-c:a", "copy", out],
+        outputs=[out],
+        inputs=[video_path],
+        duration=duration,
+        fallback=encode,
+        key=key,
+    )
+
+
+def iter_videos(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file in sorted(files):
+                    if file.lower().endswith(VIDEO_EXTS):
+                        yield os.path.join(root, file)
+        else:
+            yield path
+
+
+def extract_all(paths, out_dir="./output", jobs=None, reencode=False, timeout=None):
+    """
+    先并行探测音轨，再交给 media_jobs.JobRunner 并行提取；
+    完成记录写在 out_dir/.extract-audio.jsonl，重新运行时已经提取过的视频在探测前就跳过
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tools = find_tools()
+    log_path = os.path.join(out_dir, ".extract-audio.jsonl")
+    log = JobLog(log_path)
+    videos, skipped = [], 0
+    try:
+        for video_path in iter_videos(paths):
+            if log.done_key(audio_key(video_path, reencode), [video_path]):
+                skipped += 1
+            else:
+                videos.append(video_path)
+    finally:
+        log.close()
+    if skipped:
+        print(f"skip {skipped} videos already extracted")
+    with ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+        planned = list(
+            pool.map(lambda p: audio_job(p, out_dir, reencode, tools), videos)
+        )
+    for video_path, job in zip(videos, planned):
+        if job is None:
+            print(f"{video_path}: no audio stream")
+    runner = JobRunner(jobs, log_path=log_path, timeout=timeout)
+    return runner.run([job for job in planned if job is not None])
+
+
+def extract_audio(video_path, out_dir="./output", reencode=False):
+    job = audio_job(video_path, out_dir, reencode)
+    if job is None:
+        print(f"{video_path}: no audio stream")
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    return JobRunner(1).run([job])
 
 
 if __name__ == "__main__":
-    files_arr = [
-        "download-0.mp4",
-        "download-1.mp4",
-        "download-2.mp4",
-        "download-3.mp4",
-    ]
-    for file in files_arr:
-        extract_audio("./data/{file}")
+    parser = argparse.ArgumentParser(description="extract audio tracks from videos")
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=[f"./data/download-{i}.mp4" for i in range(4)],
+        help="video files or directories",
+    )
+    parser.add_argument("-o", "--out", default="./output")
+    parser.add_argument("-j", "--jobs", default=None, type=int, help="default: CPUs")
+    parser.add_argument(
+        "--reencode", action="store_true", help="always re-encode to mp3"
+    )
+    parser.add_argument(
+        "--timeout", default=None, type=float, help="seconds per file, default: none"
+    )
+    args = parser.parse_args()
+    extract_all(args.paths, args.out, args.jobs, args.reencode, args.timeout)
@@ -1,50 +1,223 @@
+"""
+Convert route JSON exports (DetailsRoutesWeb.json) to GPX tracks.
+
+    python gpx.py ../data/DetailsRoutesWeb.json -o ../data/routes.gpx
+    python gpx.py ../data/routes/ -o ../data/gpx/ -j 4   # every .json under the directory
+
+The file is never loaded as a whole: "tracks" and "altList" are read element by
+element (two passes over the file, so altList may come before or after tracks) and
+every point is written straight to the output as a <trkpt>, so memory stays flat
+for multi-million-point tracks. Elevation comes from altList by index, falling back
+to the point's own "alt".
+
+Input shape:
+{
+    "code": 0,
+    "message": "",
+    "data": {
+        "createTime": "2023/07/14",
+        "distance": 177.95,
+        "region": "上海市",
+        "totalAscent": 0,
+        "totalDecline": 0,
+        "wgs84trackJsonPath": "",
+        "tracks": [
+            {
+                "alt": 0.0,
+                "latitude": 31.30137183876083,
+                "longitude": 121.39867816570057
+            }
+        ],
+        "altList": [...]
+    }
+}
+"""
+
+import argparse
 import json
+import os
+import re
+import time
+from multiprocessing import Pool
+from xml.sax.saxutils import escape
+
+from _utils import iter_files, peak_rss_mb
+
+CHUNK_SIZE = 1 << 20  # characters read per refill
+SEPARATOR = re.compile(r"[\s,]*")
+# what is left of the buffer after a decoded value when a number was cut (16.|84)
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")
+GPX_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="gpx.py" xmlns="http://www.topografix.com/GPX/1/1">\n'
+    "<trk><name>{name}</name><trkseg>\n"
+)
+GPX_TAIL = "</trkseg></trk>\n</gpx>\n"
+
+
+def iter_array(path, key, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of the first array stored under `key` one at a time, reading
+    the file in chunks; yields nothing when the key is missing
+    """
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    scan = json.JSONDecoder().scan_once
+    with open(path, encoding="utf-8") as f:
+        buf, eof = "", False
+
+        def refill(keep):
+            nonlocal buf, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[keep:] + chunk
+
+        while True:
+            match = start.search(buf)
+            if match:
+                pos = match.end()
+                break
+            if eof:
+                return
+            # keep a tail in case the key is split across chunks
+            refill(max(len(buf) - len(key) - 64, 0))
+
+        while True:
+            pos = SEPARATOR.match(buf, pos).end()
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                value, end = scan(buf, pos)
+            except (StopIteration, ValueError):
+                end = None
+            # an element running up to the end of the buffer may be cut short
+            if end is None or (
+                not eof and len(buf) - end < 64 and NUMBER_TAIL.match(buf, end)
+            ):
+                if eof:
+                    raise ValueError(f"{path}: truncated or invalid {key!r} array")
+                refill(pos)
+                pos = 0
+                continue
+            yield value
+            pos = end
+
+
+def _elevation(value):
+    if isinstance(value, dict):
+        value = value.get("alt", value.get("altitude"))
+    return value
+
+
+def iter_points(path):
+    """(lat, lon, ele) per track point, ele is None when neither source has it"""
+    alts = iter_array(path, "altList")
+    for track in iter_array(path, "tracks"):
+        ele = _elevation(next(alts, None))
+        if ele is None:
+            ele = track.get("alt")
+        yield track["latitude"], track["longitude"], ele
+
+
+def trkpt(lat, lon, ele):
+    if ele is None:
+        return f'<trkpt lat="{lat}" lon="{lon}"></trkpt>\n'
+    return f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele></trkpt>\n'
+
+
+def json_to_gpx(src, dest):
+    """Stream one route JSON into a GPX file, returns the number of points"""
+    name = os.path.splitext(os.path.basename(src))[0]
+    count = 0
+    tmp = dest + ".part"
+    with open(tmp, "w", encoding="utf-8", buffering=CHUNK_SIZE) as f:
+        f.write(GPX_HEAD.format(name=escape(name)))
+        for point in iter_points(src):
+            f.write(trkpt(*point))
+            count += 1
+        f.write(GPX_TAIL)
+    # a failed run never leaves half a GPX behind
+    os.replace(tmp, dest)
+    return count
+
+
+def build_gpx(src):
+    """The same track as a gpxpy object, for small files that are edited further"""
+    # should install gpxpy
+    import gpxpy.gpx
+
+    gpx = gpxpy.gpx.GPX()
+    gpx_track = gpxpy.gpx.GPXTrack()
+    gpx.tracks.append(gpx_track)
+    gpx_segment = gpxpy.gpx.GPXTrackSegment()
+    gpx_track.segments.append(gpx_segment)
+    for lat, lon, ele in iter_points(src):
+        gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=ele))
+    return gpx
+
+
+def _convert_task(task):
+    src, out_dir = task
+    dest = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + ".gpx")
+    try:
+        return src, json_to_gpx(src, dest), None
+    except (OSError, ValueError, KeyError) as e:
+        return src, None, e
+
+
+def convert_dir(src, out, jobs=None):
+    """Convert every .json under src to out (same directory layout), jobs processes"""
+    done = failed = points = in_bytes = 0
+    start = time.perf_counter()
+    with Pool(jobs) as pool:
+        tasks = iter_files(src, out, (".json",))
+        for path, count, err in pool.imap_unordered(_convert_task, tasks):
+            if err is not None:
+                failed += 1
+                print(f"{path}: failed {err!r}")
+                continue
+            done += 1
+            points += count
+            in_bytes += os.path.getsize(path)
+            print(f"{path}: {count} points")
+    cost = time.perf_counter() - start
+    print(
+        f"{done} files ({failed} failed), {points} points in {cost:.2f}s, "
+        f"{points / cost if cost else 0:.0f} points/s, "
+        f"{in_bytes / 2 ** 20 / cost if cost else 0:.1f}MB/s, "
+        f"peak rss {peak_rss_mb():.0f}MB"
+    )
+
 
-import gpxpy.gpx
-
-gpx = gpxpy.gpx.GPX()
-
-# Create first track in our GPX:
-gpx_track = gpxpy.gpx.GPXTrack()
-gpx.tracks.append(gpx_track)
-
-# Create first segment in our GPX track:
-gpx_segment = gpxpy.gpx.GPXTrackSegment()
-gpx_track.segments.append(gpx_segment)
-
-# Create points:
-# read from json file
-# {
-#     "code": 0,
-#     "message": "",
-#     "data": {
-#         "createTime": "2023/07/14",
-#         "distance": 177.95,
-#         "region": "上海市",
-#         "totalAscent": 0,
-#         "totalDecline": 0,
-#         "wgs84trackJsonPath": "",
-#         "tracks": [
-#             {
-#                 "alt": 0.0,
-#                 "latitude": 31.30137183876083,
-#                 "longitude": 121.39867816570057
-#             }
-#         ]
-#     }
-# }
-with open("../data/DetailsRoutesWeb.json", "r") as f:
-    data = json.load(f)["data"]
-    tracks = data["tracks"]
-    altList = data["altList"]
-    for track in tracks:
-        # get alt by index
-        # "alt": 0.0,
-        # "latitude": 31.30137183876083,
-        # "longitude": 121.39867816570057
-        gpx_segment.points.append(
-            gpxpy.gpx.GPXTrackPoint(track["latitude"], track["longitude"])
-        )
-# You can add routes and waypoints, too...
-with open("../data/routes.gpx", "w") as f:
-    f.write(gpx.to_xml())
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="route JSON to GPX")
+    parser.add_argument(
+        "src",
+        nargs="?",
+        default="../data/DetailsRoutesWeb.json",
+        help="route JSON file or directory",
+    )
+    parser.add_argument(
+        "-o", "--out", default=None, help="GPX file, or output dir for a directory"
+    )
+    parser.add_argument(
+        "-j", "--jobs", default=None, type=int, help="worker processes, default: CPUs"
+    )
+    parser.add_argument(
+        "--gpxpy", action="store_true", help="build with gpxpy in memory (small files)"
+    )
+    args = parser.parse_args()
+    if os.path.isdir(args.src):
+        convert_dir(args.src, args.out or args.src, args.jobs)
+    else:
+        dest = args.out or os.path.join(os.path.dirname(args.src), "routes.gpx")
+        start = time.perf_counter()
+        if args.gpxpy:
+            with open(dest, "w", encoding="utf-8") as f:
+                f.write(build_gpx(args.src).to_xml())
+            print(f"{dest} in {time.perf_counter() - start:.2f}s")
+        else:
+            count = json_to_gpx(args.src, dest)
+            print(
+                f"{dest}: {count} points in {time.perf_counter() - start:.2f}s, "
+                f"peak rss {peak_rss_mb():.0f}MB"
+            )
@@ -0,0 +1,250 @@
+"""
+本地媒体任务队列：ffmpeg / ffprobe / gs / inkscape 等外部命令排队，N 个并发执行（默认 CPU 数）
+
+- ffmpeg 任务自动加上 -progress pipe:1，解析 out_time 输出进度（给了 duration 时是百分比）
+- 每个任务有超时，超时杀掉子进程
+- 完成的任务追加写入 jsonl 日志，重新运行时输出还在、输入没改过的任务直接跳过
+- 任务失败时可以接着跑 fallback 任务（比如 stream copy 不行时重编码）
+- 结束时输出吞吐和失败汇总
+
+    runner = JobRunner(log_path="./output/.jobs.jsonl", timeout=600)
+    runner.run([Job([ffmpeg, "-i", "a.mp4", "-vn", "a.m4a"], outputs=["a.m4a"], inputs=["a.mp4"])])
+"""
+
+import json
+import os
+import re
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _utils import get_md5
+
+PROGRESS = re.compile(r"out_time_(?:us|ms)=(\d+)")  # 两者单位都是微秒
+
+
+class Job:
+    def __init__(
+        self,
+        cmd,
+        outputs=(),
+        inputs=(),
+        name=None,
+        timeout=None,
+        duration=None,
+        fallback=None,
+        key=None,
+    ):
+        """
+        cmd: 命令参数列表；outputs / inputs: 输出和输入文件，用于跳过已完成的任务
+        timeout: 秒，覆盖 JobRunner 的默认值；duration: 媒体时长（秒），用于计算进度百分比
+        fallback: 失败后改跑的 Job，成功时记在本任务名下
+        key: 日志里的任务标识，默认为命令的 md5；命令要先探测才能确定时可以按输入给定，
+            这样不用生成命令就能用 JobLog.done_key 判断是否已完成
+        """
+        self.cmd = [str(c) for c in cmd]
+        self.outputs = [str(p) for p in outputs]
+        self.inputs = [str(p) for p in inputs]
+        self.name = name or os.path.basename(
+            self.inputs[0] if self.inputs else self.cmd[0]
+        )
+        self.timeout = timeout
+        self.duration = duration
+        self.fallback = fallback
+        self.key = key or get_md5(json.dumps(self.cmd))
+
+    @property
+    def is_ffmpeg(self):
+        return os.path.basename(self.cmd[0]).lower().startswith("ffmpeg")
+
+
+def input_stamp(paths):
+    """输入文件最新的修改时间（纳秒），没有输入时为 0"""
+    return max((os.stat(p).st_mtime_ns for p in paths if os.path.exists(p)), default=0)
+
+
+def _discard(paths):
+    """删掉失败或超时任务写了一半的输出，免得和 fallback 的输出混在一起或被当成已完成"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class JobLog:
+    """jsonl 日志，一行一个完成的任务，同一个 key 以最后一行为准"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 进程被杀时写了一半的行
+                    self.entries[entry["key"]] = entry
+        self.file = open(path, "a", encoding="utf-8") if path else None
+
+    def done(self, job):
+        return self.done_key(job.key, job.inputs)
+
+    def done_key(self, key, inputs):
+        entry = self.entries.get(key)
+        return (
+            entry is not None
+            and entry["stamp"] == input_stamp(inputs)
+            and all(os.path.exists(p) for p in entry["outputs"])
+        )
+
+    def record(self, job, outputs, cost):
+        entry = {
+            "key": job.key,
+            "name": job.name,
+            "outputs": outputs,
+            "stamp": input_stamp(job.inputs),
+            "cost": round(cost, 3),
+            "time": int(time.time()),
+        }
+        with self.lock:
+            self.entries[job.key] = entry
+            if self.file:
+                self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class JobRunner:
+    def __init__(self, jobs=None, log_path=None, timeout=None, verbose=True):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.log_path = log_path
+        self.timeout = timeout
+        self.verbose = verbose
+        self.lock = threading.Lock()
+
+    def _print(self, *args):
+        if self.verbose:
+            with self.lock:
+                print(*args, flush=True)
+
+    def _execute(self, job):
+        """运行一条命令，返回 (状态, 错误输出)，状态为 ok / failed / timeout"""
+        cmd = job.cmd
+        if job.is_ffmpeg:
+            cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+        timeout = job.timeout or self.timeout
+        killed = threading.Event()
+        # stderr 写到临时文件，不会因为管道写满而和读 stdout 互相卡住
+        with tempfile.TemporaryFile() as err:
+            try:
+                proc = subprocess.Popen(
+                    cmd,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=err,
+                    text=True,
+                    errors="replace",
+                    # 自成进程组，超时时连同子进程一起杀掉（Windows 上忽略）
+                    start_new_session=True,
+                )
+            except OSError as e:
+                return "failed", str(e)
+
+            def kill():
+                killed.set()
+                try:
+                    if hasattr(os, "killpg"):
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    else:
+                        proc.kill()
+                except ProcessLookupError:
+                    pass  # 刚好已经退出
+
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer:
+                timer.start()
+            last = 0.0
+            try:
+                for line in proc.stdout:
+                    match = PROGRESS.match(line)
+                    if match and time.monotonic() - last >= 1:
+                        last = time.monotonic()
+                        done = int(match.group(1)) / 1e6
+                        if job.duration:
+                            self._print(f"  {job.name} {done / job.duration:.0%}")
+                        else:
+                            self._print(f"  {job.name} {done:.1f}s")
+                proc.wait()
+            finally:
+                if timer:
+                    timer.cancel()
+            if killed.is_set():
+                return "timeout", f"killed after {timeout}s"
+            if proc.returncode != 0:
+                err.seek(0)
+                tail = err.read()[-2000:].decode("utf-8", "replace").strip()
+                return "failed", tail or f"exit code {proc.returncode}"
+        return "ok", None
+
+    def _run_one(self, job, log):
+        if log.done(job):
+            return job, "skipped", None, 0
+        start = time.perf_counter()
+        status, err = self._execute(job)
+        used = job
+        if status != "ok":
+            _discard(job.outputs)
+        if status == "failed" and job.fallback is not None:
+            self._print(f"  {job.name}: {status}, running fallback")
+            used = job.fallback
+            status, err = self._execute(used)
+            if status != "ok":
+                _discard(used.outputs)
+        if status == "ok":
+            log.record(job, used.outputs, time.perf_counter() - start)
+            size = sum(os.path.getsize(p) for p in used.outputs if os.path.exists(p))
+            return job, "ok", None, size
+        return job, status, err, 0
+
+    def run(self, jobs):
+        """执行全部任务，返回 {ok, skipped, failed, timeout, bytes, seconds, failures}"""
+        log = JobLog(self.log_path)
+        summary = {"ok": 0, "skipped": 0, "failed": 0, "timeout": 0, "bytes": 0}
+        failures = []
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(self.jobs) as pool:
+                results = pool.map(lambda j: self._run_one(j, log), jobs)
+                for n, (job, status, err, size) in enumerate(results, 1):
+                    summary[status] += 1
+                    summary["bytes"] += size
+                    if err:
+                        failures.append((job.name, status, err))
+                    self._print(f"[{n}] {job.name}: {status}")
+        finally:
+            log.close()
+        cost = time.perf_counter() - start
+        ran = summary["ok"] + summary["failed"] + summary["timeout"]
+        summary["seconds"] = cost
+        summary["failures"] = failures
+        print(
+            f"{summary['ok']} done, {summary['skipped']} skipped, "
+            f"{summary['failed']} failed, {summary['timeout']} timed out "
+            f"in {cost:.2f}s with {self.jobs} workers; "
+            f"{ran / cost if cost else 0:.2f} jobs/s, "
+            f"{summary['bytes'] / 2 ** 20:.1f}MB written "
+            f"({summary['bytes'] / 2 ** 20 / cost if cost else 0:.1f}MB/s)"
+        )
+        for name, status, err in failures:
+            print(f" - {name} ({status}): {err.splitlines()[-1] if err else ''}")
+        return summary
@@ -0,0 +1,167 @@
+"""
+本地订单簿：按币安文档维护 depth 增量流
+https://github.com/binance-us/binance-us-api-docs/blob/master/web-socket-streams.md#how-to-manage-a-local-order-book-correctly
+
+1. 订阅 <symbol>@depth，先缓存收到的增量
+2. 拉取快照 /api/v3/depth?symbol=BNBBTC&limit=1000
+3. 丢弃 u <= lastUpdateId 的增量，第一条要满足 U <= lastUpdateId+1 <= u
+4. 之后每条的 U 都应等于上一条的 u+1，否则重新拉快照
+5. 数量为 0 表示删除该价位
+
+离线回放（快照和录制的增量，每行一条原始消息）：
+
+    python orderbook.py --snapshot ../data/bnbbtc-snapshot.json --diffs ../data/bnbbtc@depth.jsonl
+"""
+
+import argparse
+import json
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+
+
+class UpdateLatency:
+    """最近 size 条更新耗时的环形缓冲，单位纳秒"""
+
+    def __init__(self, size=10000):
+        self.samples = array("q", bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        self.samples[self.count % self.size] = ns
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def summary(self):
+        if not self.count:
+            return "no updates"
+        recent = sorted(self.samples[: min(self.count, self.size)])
+        return "n=%d mean=%.1fus p50=%.1fus p99=%.1fus max=%.1fus" % (
+            self.count,
+            self.total / self.count / 1000,
+            recent[len(recent) // 2] / 1000,
+            recent[int(len(recent) * 0.99)] / 1000,
+            self.max / 1000,
+        )
+
+
+def _update(levels, prices, price, qty):
+    """levels 为 价格->数量，prices 为升序价格表，二分查找定位"""
+    if qty == 0:
+        if levels.pop(price, None) is not None:
+            del prices[bisect_left(prices, price)]
+    else:
+        if price not in levels:
+            insort(prices, price)
+        levels[price] = qty
+
+
+class OrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids, self.asks = {}, {}
+        self.bid_prices = []  # 升序，最优买价在末尾
+        self.ask_prices = []  # 升序，最优卖价在开头
+        self.last_update_id = None  # None 表示等待快照
+        self.pending = deque()
+        self.latency = UpdateLatency()
+
+    @property
+    def synced(self):
+        return self.last_update_id is not None
+
+    def load_snapshot(self, snapshot):
+        """加载 REST 快照，然后应用快照之前缓存的增量"""
+        self.bids = {float(p): float(q) for p, q in snapshot["bids"] if float(q)}
+        self.asks = {float(p): float(q) for p, q in snapshot["asks"] if float(q)}
+        self.bid_prices = sorted(self.bids)
+        self.ask_prices = sorted(self.asks)
+        self.last_update_id = snapshot["lastUpdateId"]
+        pending, self.pending = self.pending, deque()
+        for event in pending:
+            self.apply(event)
+
+    def apply(self, event):
+        """应用一条 depthUpdate，返回是否生效；发现断档时置为未同步，需要重新加载快照"""
+        if self.last_update_id is None:
+            self.pending.append(event)
+            return False
+        if event["u"] <= self.last_update_id:
+            return False
+        if event["U"] > self.last_update_id + 1:
+            print(f"{self.symbol} gap {self.last_update_id} -> {event['U']}, resync")
+            self.last_update_id = None
+            self.pending.append(event)
+            return False
+
+        start = time.perf_counter_ns()
+        for p, q in event["b"]:
+            _update(self.bids, self.bid_prices, float(p), float(q))
+        for p, q in event["a"]:
+            _update(self.asks, self.ask_prices, float(p), float(q))
+        self.last_update_id = event["u"]
+        self.latency.add(time.perf_counter_ns() - start)
+        return True
+
+    def best_bid(self):
+        if not self.bid_prices:
+            return None
+        p = self.bid_prices[-1]
+        return p, self.bids[p]
+
+    def best_ask(self):
+        if not self.ask_prices:
+            return None
+        p = self.ask_prices[0]
+        return p, self.asks[p]
+
+    def spread(self):
+        if not self.bid_prices or not self.ask_prices:
+            return None
+        return self.ask_prices[0] - self.bid_prices[-1]
+
+    def qty(self, price):
+        """某价位的挂单量"""
+        return self.bids.get(price) or self.asks.get(price, 0.0)
+
+    def depth(self, n=10):
+        """前 n 档 ([(bid, qty)...], [(ask, qty)...])，由优到劣"""
+        bids = [(p, self.bids[p]) for p in self.bid_prices[: -n - 1 : -1]]
+        asks = [(p, self.asks[p]) for p in self.ask_prices[:n]]
+        return bids, asks
+
+
+def replay(book, snapshot_path, diffs_path):
+    """离线回放：先缓存全部增量再加载快照，与实时流程一致"""
+    with open(diffs_path) as f:
+        for line in f:
+            if line.strip():
+                msg = json.loads(line)
+                msg = msg.get("data", msg)
+                if msg.get("e") == "depthUpdate":
+                    book.apply(msg)
+    with open(snapshot_path) as f:
+        book.load_snapshot(json.load(f))
+    return book
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replay captured depth diffs")
+    parser.add_argument("--symbol", default="BNBBTC")
+    parser.add_argument("--snapshot", required=True, help="REST depth snapshot json")
+    parser.add_argument("--diffs", required=True, help="captured depthUpdate lines")
+    parser.add_argument("--levels", default=5, type=int)
+    args = parser.parse_args()
+
+    ob = replay(OrderBook(args.symbol), args.snapshot, args.diffs)
+    print("synced:", ob.synced, "lastUpdateId:", ob.last_update_id)
+    bid_levels, ask_levels = ob.depth(args.levels)
+    for (bp, bq), (ap, aq) in zip(bid_levels, ask_levels):
+        print(f"{bq:>14.6f} {bp:<14.8f} | {ap:>14.8f} {aq:<14.6f}")
+    print("update latency:", ob.latency.summary())
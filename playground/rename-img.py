@@ -3,13 +3,43 @@
 Created on 2013年10月21日
 
 @author: genffy
+
+Batch rename photos by camera model:
+
+    python rename-img.py ~/Desktop/upload --jobs 16 --dry-run
+    python rename-img.py ~/Desktop/upload --naming time   # genffy-<model>-20230607-163610-001.jpg
+    python rename-img.py ~/Desktop/upload --naming hash   # genffy-<model>-<sha256 prefix>.jpg
+
+The hash and time namings are deterministic: the same files always get the same
+names, and files that already carry such a name are skipped, so runs can be repeated.
+
+EXIF is read from the file header only (Image.open is lazy, getexif() stops at
+the start of the image data), on a thread pool. All new names are planned before
+anything is renamed, so names never collide; the renames are then applied as one
+batch and rolled back if any of them fails.
 """
 
+import argparse
+import hashlib
+import itertools
 import os
 import os.path
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from random import Random
-import Image
-from ExifTags import TAGS
+
+from PIL import ExifTags, Image
+
+IMAGE_EXTS = (".jpg", ".jpeg")
+TAGS = {name: tag for tag, name in ExifTags.TAGS.items()}
+NAMINGS = ("random", "hash", "time")
+HASH_LEN = 12
+# stems produced by the deterministic namings (after the prefix)
+DONE = {
+    "hash": r"-.+-[0-9a-f]{%d}(-\d+)?" % HASH_LEN,
+    "time": r"-.+-\d{8}-\d{6}-\d{3,}",
+}
 
 """
 @see: get randomString
@@ -17,14 +47,10 @@ from ExifTags import TAGS
 """
 
 
-def random_str(random_len=8):
-    stri = ""
+def random_str(random_len=8, random=None):
     chars = "AaBbCcDdEeFfGgHhIiJjKkLlMmNnOoPpQqRrSsTtUuVvWwXxYyZz0123456789"
-    length = len(chars) - 1
-    random = Random()
-    for i in range(random_len):
-        stri += chars[random.randint(0, length)]
-    return stri
+    random = random or Random()
+    return "".join(random.choice(chars) for _ in range(random_len))
 
 
 """
@@ -33,21 +59,138 @@ def random_str(random_len=8):
 """
 
 
+def _clean(value):
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "ignore")
+    if value is None:
+        return None
+    value = str(value).strip("\x00 ").replace(" ", "-").replace("/", "-")
+    return value or None
+
+
+def read_exif(fname, keys):
+    """Several EXIF tags (by name) from IFD0 and the Exif sub-IFD in one header read."""
+    try:
+        with Image.open(fname) as img:
+            exif = img.getexif()
+            sub = exif.get_ifd(ExifTags.IFD.Exif)
+    except (OSError, SyntaxError) as e:
+        print(f"IOERROR {fname}: {e}")
+        return dict.fromkeys(keys)
+    return {
+        key: _clean(sub[TAGS[key]] if TAGS[key] in sub else exif.get(TAGS[key]))
+        for key in keys
+    }
+
+
 def get_exif_data(fname, key):
-    """Get embedded EXIF data from image file."""
-    ret = {}
+    """Get one embedded EXIF tag (by name) from the image header, None if missing."""
+    return read_exif(fname, (key,))[key]
+
+
+def content_hash(fname, length=HASH_LEN):
+    h = hashlib.sha256()
+    with open(fname, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()[:length]
+
+
+def capture_time(fname, info):
+    """YYYYmmdd-HHMMSS from DateTimeOriginal, then DateTime, then the file mtime"""
+    for stamp in (info["DateTimeOriginal"], info["DateTime"]):
+        try:
+            return time.strftime(
+                "%Y%m%d-%H%M%S", time.strptime(stamp, "%Y:%m:%d-%H:%M:%S")
+            )
+        except (TypeError, ValueError):
+            pass
+    return time.strftime("%Y%m%d-%H%M%S", time.localtime(os.path.getmtime(fname)))
+
+
+def name_key(fname, naming):
+    """(model, key): key is the content hash prefix, the capture time or None (random)"""
+    info = read_exif(fname, ("Model", "DateTimeOriginal", "DateTime"))
+    if naming == "hash":
+        return info["Model"], content_hash(fname)
+    if naming == "time":
+        return info["Model"], capture_time(fname, info)
+    return info["Model"], None
+
+
+def is_renamed(fname, prefix, naming):
+    """Whether the file already carries a deterministic name, so re-runs leave it alone."""
+    stem = os.path.splitext(os.path.basename(fname))[0]
+    return re.fullmatch(re.escape(prefix) + DONE[naming], stem) is not None
+
+
+"""
+@see: plan and apply renames
+
+"""
+
+
+def iter_images(startdir):
+    # sorted walk: sequence numbers come out the same on every run
+    for dirpath, dirnames, filenames in os.walk(startdir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTS:
+                yield os.path.join(dirpath, filename)
+
+
+def _candidates(base, key, naming, random):
+    if naming == "random":
+        while True:
+            yield f"{base}-{random_str(random=random)}"
+    elif naming == "hash":
+        # same prefix means (almost certainly) the same content: number the duplicates
+        yield f"{base}-{key}"
+        for seq in itertools.count(1):
+            yield f"{base}-{key}-{seq}"
+    else:
+        for seq in itertools.count(1):
+            yield f"{base}-{key}-{seq:03d}"
+
+
+def plan_renames(paths, infos, prefix="genffy", naming="random"):
+    """
+    [(old path, new path)] for all images, infos are name_key() results; new names
+    are unique within their directory and never take the name of a file that is
+    already there
+    """
+    taken = {}  # dirpath -> names in use (existing files and planned names)
+    random = Random()
+    plan = []
+    for path, (model, key) in zip(paths, infos):
+        dirpath, filename = os.path.split(path)
+        names = taken.get(dirpath)
+        if names is None:
+            names = taken[dirpath] = set(os.listdir(dirpath or "."))
+        ext = os.path.splitext(filename)[1]
+        base = f"{prefix}-{model or 'unknown'}"
+        for stem in _candidates(base, key, naming, random):
+            if stem + ext not in names:
+                break
+        names.add(stem + ext)
+        plan.append((path, os.path.join(dirpath, stem + ext)))
+    return plan
+
+
+def apply_renames(plan):
+    """Apply the whole plan or nothing: on the first failure undo what was done and re-raise."""
+    done = []
     try:
-        img = Image.open(fname)
-        if hasattr(img, "_getexif"):
-            exifinfo = img._getexif()
-            if exifinfo != None:
-                for tag, value in exifinfo.items():
-                    decoded = TAGS.get(tag, tag)
-                    if key == decoded:
-                        ret[decoded] = value
-    except IOError:
-        print("IOERROR " + fname)
-    return ret.get(key).replace(" ", "-")
+        for old, new in plan:
+            if os.path.exists(new):
+                raise FileExistsError(new)
+            os.rename(old, new)
+            done.append((old, new))
+    except OSError:
+        for old, new in reversed(done):
+            os.rename(new, old)
+        raise
+    return done
 
 
 """
@@ -56,26 +199,52 @@ def get_exif_data(fname, key):
 """
 
 
-def rename_img(startdir):
-    exif_log = open("exif_log.txt", "a")
-    for dirpath, dirnames, filenames in os.walk(startdir):
-        for filename in filenames:
-            if os.path.splitext(filename)[1] == ".jpg":
-                filepath = os.path.join(dirpath, filename)
-                newname = (
-                    "genffy-"
-                    + get_exif_data(startdir + "/" + filename, "Model")
-                    + "-"
-                    + random_str()
-                    + ".jpg"
-                )
-                os.rename(
-                    os.path.join(dirpath, filename), os.path.join(dirpath, newname)
-                )
-                exif_log.write(filename + "\n")
-                print(filename)
+def rename_img(
+    startdir,
+    jobs=8,
+    log="exif_log.txt",
+    dry_run=False,
+    prefix="genffy",
+    naming="random",
+):
+    paths = list(iter_images(startdir))
+    if naming != "random":
+        todo = [p for p in paths if not is_renamed(p, prefix, naming)]
+        if len(todo) < len(paths):
+            print(f"skip {len(paths) - len(todo)} images already renamed")
+        paths = todo
+    with ThreadPoolExecutor(jobs) as pool:
+        infos = list(pool.map(lambda p: name_key(p, naming), paths))
+    plan = plan_renames(paths, infos, prefix, naming)
+    if not dry_run:
+        apply_renames(plan)
+    # one buffered write for the whole batch instead of a write per file
+    lines = "".join(f"{old}\t{new}\n" for old, new in plan)
+    if dry_run:
+        print(lines, end="")
+    else:
+        with open(log, "a", encoding="utf-8") as f:
+            f.write(lines)
+    print(f"{'planned' if dry_run else 'renamed'} {len(plan)} images in {startdir}")
+    return plan
 
 
 if __name__ == "__main__":
-    startdir = "C:/Users/genffy/Desktop/upload"
-    rename_img(startdir)
+    parser = argparse.ArgumentParser(description="rename photos by camera model")
+    parser.add_argument("startdir", nargs="?", default="C:/Users/genffy/Desktop/upload")
+    parser.add_argument("-j", "--jobs", default=8, type=int, help="EXIF reader threads")
+    parser.add_argument("--log", default="exif_log.txt", help="old -> new name log")
+    parser.add_argument("--prefix", default="genffy")
+    parser.add_argument(
+        "--naming",
+        default="random",
+        choices=NAMINGS,
+        help="name suffix: random chars, content hash prefix or capture time + sequence",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="print the plan, rename nothing"
+    )
+    args = parser.parse_args()
+    rename_img(
+        args.startdir, args.jobs, args.log, args.dry_run, args.prefix, args.naming
+    )
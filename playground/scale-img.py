@@ -1,72 +1,353 @@
+import argparse
 import base64
+import binascii
 import io
+import itertools
 import os
+import shutil
+import time
+from multiprocessing import Pool
+
 from PIL import Image
 from PIL import ImageFile
 
+from _utils import budget_pixels, iter_files, open_image, peak_rss_mb
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+JPEG_EXTS = (".jpg", ".jpeg")
+
+
+def encode_jpeg(im, quality):
+    """编码到内存，返回 BytesIO 缓冲区的 memoryview，不再复制一份 bytes"""
+    buf = io.BytesIO()
+    im.save(buf, "JPEG", quality=quality)
+    return buf.getbuffer()
+
+
+def fit_jpeg(im, target, quality=85, min_quality=30, min_scale=0.05):
+    """在内存中把图片编码为不超过 target 字节的 JPEG
+    先在 [min_quality, quality] 内二分质量；最低质量仍然超标时，固定 min_quality 二分缩放比例
+    :return: (jpeg 数据, 质量, 缩放比例, 编码次数)
+    """
+    if im.mode not in ("RGB", "L"):
+        im = im.convert("RGB")
+    # 最低质量都超标时直接进入缩放，省掉整幅图的质量二分
+    data = encode_jpeg(im, min_quality)
+    encodes = 1
+    best = (data, min_quality) if len(data) <= target else None
+    lo, hi = min_quality + 1, quality if best else min_quality - 1
+    while lo <= hi:
+        q = (lo + hi) // 2
+        data = encode_jpeg(im, q)
+        encodes += 1
+        if len(data) <= target:
+            best, lo = (data, q), q + 1
+        else:
+            hi = q - 1
+    if best:
+        return best[0], best[1], 1.0, encodes
+
+    # 文件大小约与像素数成正比，以此估计的比例作为二分上界，先一次缩到上界，后续都从这张小图缩放
+    top = min(1.0, (target / len(data)) ** 0.5 * 1.2)
+    min_scale = min(min_scale, top)
+    lo, best, full = min_scale, None, im
+    while top < 1.0:
+        w, h = full.size
+        im = full.resize((max(1, int(w * top)), max(1, int(h * top))), Image.LANCZOS)
+        data = encode_jpeg(im, min_quality)
+        encodes += 1
+        if len(data) > target:
+            break
+        # 缩小后更难压缩（比如高熵图片）时估计偏小：上界翻倍直到超标，原图已知超标
+        best, lo = (data, top), top
+        top = min(1.0, top * 2)
+    else:
+        im = full
+
+    def shrink(scale):
+        ratio = scale / top
+        size = (max(1, int(im.size[0] * ratio)), max(1, int(im.size[1] * ratio)))
+        return encode_jpeg(im.resize(size, Image.LANCZOS), min_quality)
+
+    hi = top
+    while hi - lo > 0.01:
+        scale = (lo + hi) / 2
+        data = shrink(scale)
+        encodes += 1
+        if len(data) <= target:
+            best, lo = (data, scale), scale
+        else:
+            hi = scale
+    if best is None:
+        best = shrink(min_scale), min_scale
+        encodes += 1
+    return best[0], min_quality, best[1], encodes
+
+
 # # 压缩图片文件
 
 
-def compress_image(outfile, mb=190, quality=85, k=0.9):
-    """不改变图片尺寸压缩到指定大小
-    :param outfile: 压缩文件保存地址
-    :param mb: 压缩目标，KB
-    :param step: 每次调整的压缩比率
-    :param quality: 初始压缩比率
-    :return: 压缩文件地址，压缩文件大小
+def is_jpeg(path):
+    with open(path, "rb") as f:
+        return f.read(3) == b"\xff\xd8\xff"
+
+
+def jpeg_path(path):
     """
+    非 JPEG 图片压缩后的输出路径：a.png -> a.jpg；
+    a.jpg 已存在且比 a.png 旧（是另一张图片，不是上次的输出）时为 a.png.jpg
+    """
+    dest = os.path.splitext(path)[0] + ".jpg"
+    if os.path.exists(dest) and os.path.getmtime(dest) < os.path.getmtime(path):
+        dest = path + ".jpg"
+    return dest
 
-    o_size = os.path.getsize(outfile) // 1024
-    print(o_size, mb)
-    if o_size <= mb:
-        return outfile
+
+def compress_file(
+    src,
+    dest,
+    mb=190,
+    quality=85,
+    max_size=None,
+    min_quality=30,
+    memory_mb=None,
+    fit_memory=False,
+):
+    """把 src 压缩到 mb KB 以内写到 dest（可以与 src 相同），已达标且不限尺寸的 JPEG 原样复制，
+    其他格式总是重新编码为 JPEG（原地压缩时不动）
+    memory_mb 为解码内存预算，超出时抛 ValueError；fit_memory 为 True 时改为在解码时缩小
+    （JPEG，见 _utils.open_image）
+    :return: (原大小, 压缩后大小, 质量, 缩放比例, 编码次数)，未重新编码时质量为 None
+    """
+    o_size = os.path.getsize(src)
+    in_place = os.path.abspath(src) == os.path.abspath(dest)
+    if o_size <= mb * 1024 and not max_size and (in_place or is_jpeg(src)):
+        if not in_place:
+            shutil.copyfile(src, dest)
+        return o_size, o_size, None, 1.0, 0
+    if in_place and not is_jpeg(src):
+        raise ValueError(f"{src}: not a JPEG, write the JPEG to another path")
 
     ImageFile.LOAD_TRUNCATED_IMAGES = True
-    while o_size > mb:
-        im = Image.open(outfile)
-        x, y = im.size
-        out = im.resize((int(x * k), int(y * k)), Image.ANTIALIAS)
-        try:
-            out.save(outfile, quality=quality)
-        except Exception as e:
-            print(e)
-            break
-        o_size = os.path.getsize(outfile) // 1024
-    return outfile
+    im = open_image(src, max_size, budget_pixels(memory_mb), fit_memory)
+    data, q, scale, encodes = fit_jpeg(im, mb * 1024, quality, min_quality)
+    with open(dest, "wb") as f:
+        f.write(data)
+    return o_size, len(data), q, scale, encodes
 
 
-# # 压缩base64的图片
-def compress_image_bs4(b64, mb=190, k=0.9):
-    """不改变图片尺寸压缩到指定大小
+def compress_image(
+    outfile,
+    mb=190,
+    quality=85,
+    max_size=None,
+    min_quality=30,
+    memory_mb=None,
+    fit_memory=False,
+):
+    """压缩到指定大小，先降质量再缩小尺寸，全程在内存中编码，最后只写一次文件
+    输出总是 JPEG：非 JPEG 图片写到旁边的 .jpg（见 jpeg_path），原文件不动
     :param outfile: 压缩文件保存地址
     :param mb: 压缩目标，KB
-    :param step: 每次调整的压缩比率
-    :param quality: 初始压缩比率
-    :return: 压缩文件地址，压缩文件大小
+    :param quality: 最高质量
+    :param max_size: 最长边上限，JPEG 在解码时直接缩小（见 _utils.open_image）
+    :param min_quality: 最低质量，仍然超标时开始缩小尺寸
+    :param memory_mb: 解码内存预算，MB，超出时抛 ValueError
+    :param fit_memory: 超出预算时缩小到预算以内，而不是抛错
+    :return: 压缩文件地址
+    """
+    dest = outfile
+    if not is_jpeg(outfile) and (os.path.getsize(outfile) > mb * 1024 or max_size):
+        dest = jpeg_path(outfile)
+    o_size, size, q, scale, encodes = compress_file(
+        outfile, dest, mb, quality, max_size, min_quality, memory_mb, fit_memory
+    )
+    if q is not None:
+        print(
+            f"{dest}: {o_size // 1024}KB -> {size // 1024}KB "
+            f"quality={q} scale={scale:.2f} encodes={encodes}"
+        )
+    return dest
+
+
+# # 压缩base64的图片
+def compress_image_bs4(b64, mb=190, quality=85):
+    """压缩 base64 图片到指定大小
+    解码结果直接交给 BytesIO（不复制），编码结果以 memoryview 交给 b64encode
+    :param b64: base64 字符串或 bytes
+    :param mb: 压缩目标，KB
+    :param quality: 最高质量
+    :return: 压缩后的 base64 字符串
+    """
+    raw = binascii.a2b_base64(b64)
+    if len(raw) // 1024 <= mb:
+        return b64 if isinstance(b64, str) else b64.decode("ascii")
+    with io.BytesIO(raw) as im:
+        data, _, _, _ = fit_jpeg(Image.open(im), mb * 1024, quality)
+    return base64.b64encode(data).decode("ascii")
+
+
+def _jpeg_names(name):
+    stem = os.path.splitext(name)[0]
+    yield stem + ".jpg"
+    yield name + ".jpg"
+    for seq in itertools.count(1):
+        yield f"{name}-{seq}.jpg"
+
+
+def plan_outputs(src, out):
+    """
+    ([(源文件, 输出文件)], 跳过的文件数)：JPEG 保留原名，其他格式输出为 stem.jpg；
+    该名字已被占用（比如同目录还有 a.jpg）时改为 a.png.jpg、a.png-1.jpg ...
+    候选名字已经存在且不比源文件旧时视为上次运行的输出，跳过这个源文件，重复运行不会越写越多
     """
-    f = base64.b64decode(b64)
-    with io.BytesIO(f) as im:
-        o_size = len(im.getvalue()) // 1024
-        if o_size <= mb:
-            return b64
-        im_out = im
-        while o_size > mb:
-            img = Image.open(im_out)
-            x, y = img.size
-            out = img.resize((int(x * k), int(y * k)), Image.ANTIALIAS)
-            im_out.close()
-            im_out = io.BytesIO()
-            out.save(im_out, "jpeg")
-            o_size = len(im_out.getvalue()) // 1024
-        b64 = base64.b64encode(im_out.getvalue())
-        im_out.close()
-        return str(b64, encoding="utf8")
+    files = list(iter_files(src, out, IMAGE_EXTS))
+    is_src_jpeg = [path.lower().endswith(JPEG_EXTS) for path, _ in files]
+    claimed = {
+        os.path.join(out_dir, os.path.basename(path))
+        for (path, out_dir), jpeg in zip(files, is_src_jpeg)
+        if jpeg
+    }
+    plan, skipped = [], 0
+    for (path, out_dir), jpeg in zip(files, is_src_jpeg):
+        name = os.path.basename(path)
+        if jpeg:
+            plan.append((path, os.path.join(out_dir, name)))
+            continue
+        mtime = os.path.getmtime(path)
+        for candidate in _jpeg_names(name):
+            dest = os.path.join(out_dir, candidate)
+            if os.path.exists(dest) and os.path.getmtime(dest) >= mtime:
+                dest = None  # 上次的输出
+                break
+            if dest not in claimed:
+                break
+        if dest is None:
+            skipped += 1
+            continue
+        claimed.add(dest)
+        plan.append((path, dest))
+    return plan, skipped
+
+
+def _compress_task(task):
+    """进程池任务"""
+    src, dest, kb, quality, max_size, memory_mb, fit_memory = task
+    try:
+        stats = compress_file(
+            src,
+            dest,
+            kb,
+            quality,
+            max_size,
+            memory_mb=memory_mb,
+            fit_memory=fit_memory,
+        )
+        return src, stats, None
+    except (OSError, ValueError) as e:
+        return src, None, e
+
+
+def compress_dir(
+    src,
+    out,
+    kb=190,
+    quality=85,
+    max_size=None,
+    jobs=None,
+    memory_mb=None,
+    fit_memory=False,
+):
+    """递归压缩 src 下的图片到 out（保持目录结构），jobs 个进程并行"""
+    plan, skipped = plan_outputs(src, out)
+    if skipped:
+        print(f"skip {skipped} images already compressed")
+    tasks = (
+        (path, dest, kb, quality, max_size, memory_mb, fit_memory)
+        for path, dest in plan
+    )
+    done = failed = in_bytes = out_bytes = 0
+    start = time.perf_counter()
+    with Pool(jobs) as pool:
+        for path, stats, err in pool.imap_unordered(_compress_task, tasks, chunksize=8):
+            if err is not None:
+                failed += 1
+                print(f"{path}: failed {err!r}")
+                continue
+            o_size, size, q, scale, encodes = stats
+            done += 1
+            in_bytes += o_size
+            out_bytes += size
+            note = (
+                "copied" if q is None else f"q={q} scale={scale:.2f} encodes={encodes}"
+            )
+            print(
+                f"{path}: {o_size // 1024}KB -> {size // 1024}KB "
+                f"({size / o_size:.0%}) {note}"
+            )
+    cost = time.perf_counter() - start
+    print(
+        f"{done} images ({failed} failed) in {cost:.2f}s, "
+        f"{in_bytes / 2 ** 20:.1f}MB -> {out_bytes / 2 ** 20:.1f}MB "
+        f"({out_bytes / in_bytes if in_bytes else 0:.0%}), "
+        f"{done / cost if cost else 0:.1f} images/s, "
+        f"{in_bytes / 2 ** 20 / cost if cost else 0:.1f}MB/s, "
+        f"peak rss {peak_rss_mb():.0f}MB"
+    )
 
 
 if __name__ == "__main__":
-    for img in os.listdir("../data/img/"):
-        # print(str(img))
-        compress_image(outfile="./data/img/" + str(img))
+    parser = argparse.ArgumentParser(description="compress images to a target size")
+    parser.add_argument(
+        "src", nargs="?", default="./data/img/", help="image file or directory"
+    )
+    parser.add_argument(
+        "-o", "--out", default=None, help="output dir, default: overwrite in place"
+    )
+    parser.add_argument("--kb", default=190, type=int, help="target size in KB")
+    parser.add_argument("--quality", default=85, type=int, help="highest quality")
+    parser.add_argument(
+        "--max-size",
+        default=None,
+        type=int,
+        help="longest side limit, JPEG is reduced while decoding",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        default=None,
+        type=int,
+        help="decode memory budget per worker, larger images are skipped",
+    )
+    parser.add_argument(
+        "--fit-memory",
+        action="store_true",
+        help="reduce images over --memory-mb to fit instead (JPEG while decoding)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", default=None, type=int, help="worker processes, default: CPUs"
+    )
+    args = parser.parse_args()
+    if os.path.isfile(args.src):
+        compress_image(
+            args.src,
+            args.kb,
+            args.quality,
+            args.max_size,
+            memory_mb=args.memory_mb,
+            fit_memory=args.fit_memory,
+        )
+        print(f"peak rss {peak_rss_mb():.0f}MB")
+    else:
+        compress_dir(
+            args.src,
+            args.out or args.src,
+            args.kb,
+            args.quality,
+            args.max_size,
+            args.jobs,
+            args.memory_mb,
+            args.fit_memory,
+        )
     print("完")
 # from PIL import Image
 
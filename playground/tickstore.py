@@ -0,0 +1,408 @@
+"""
+行情录制：把 crypto-listen.py 收到的 kline / depth 消息按列压缩存盘，供回测和回放使用。
+
+目录结构（按 UTC 小时分块，只追加）：
+
+    root/
+    └── BNBBTC/
+        ├── depth/20240101-08.tk
+        └── kline/20240101-08.tk
+
+每个 .tk 文件由若干 block 组成：b"TK01" + 行数 + 列数，之后每列为 长度 + zlib 压缩后的数据，
+时间戳和 update id 列先做差分再压缩。进程被杀掉时写了一半的 block 会被读取端跳过，
+重新启动的录制进程第一次追加某个文件前先把这段残留截掉。
+
+    python tickstore.py replay --root ../data/ticks --symbol BNBBTC --kind depth
+    python tickstore.py backtest --root ../data/ticks --symbol DYDXUSDT --init 3
+"""
+
+import argparse
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b"TK01"
+HOUR_MS = 3600 * 1000
+SCHEMAS = {
+    "kline": [
+        ("t", "<i8"),
+        ("E", "<i8"),
+        ("o", "<f8"),
+        ("h", "<f8"),
+        ("l", "<f8"),
+        ("c", "<f8"),
+        ("v", "<f8"),
+        ("x", "u1"),
+    ],
+    # 一行一个价位变动，同一条消息的行共享 E/U/u；side 1 买 -1 卖 0 空消息
+    "depth": [
+        ("E", "<i8"),
+        ("U", "<i8"),
+        ("u", "<i8"),
+        ("side", "i1"),
+        ("price", "<f8"),
+        ("qty", "<f8"),
+    ],
+}
+DELTA = {"t", "E", "U", "u"}
+
+
+def encode_block(rows, kind):
+    arr = np.array(rows, dtype=SCHEMAS[kind])
+    parts = [MAGIC, struct.pack("<II", len(arr), len(SCHEMAS[kind]))]
+    for name, _ in SCHEMAS[kind]:
+        col = arr[name]
+        if name in DELTA:
+            col = np.diff(col, prepend=col.dtype.type(0))
+        data = zlib.compress(np.ascontiguousarray(col).tobytes())
+        parts.append(struct.pack("<I", len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def to_rows(msg):
+    """消息 -> (symbol, kind, 小时, 行)，不认识的消息返回 None"""
+    data = msg.get("data", msg)
+    event = data.get("e")
+    if event == "kline":
+        k = data["k"]
+        row = (
+            k["t"],
+            data["E"],
+            float(k["o"]),
+            float(k["h"]),
+            float(k["l"]),
+            float(k["c"]),
+            float(k["v"]),
+            1 if k["x"] else 0,
+        )
+        return data["s"], "kline", data["E"] // HOUR_MS, [row]
+    if event == "depthUpdate":
+        head = (data["E"], data["U"], data["u"])
+        rows = [head + (1, float(p), float(q)) for p, q in data["b"]]
+        rows += [head + (-1, float(p), float(q)) for p, q in data["a"]]
+        return data["s"], "depth", data["E"] // HOUR_MS, rows or [head + (0, 0.0, 0.0)]
+    return None
+
+
+class TickRecorder:
+    """
+    后台线程写盘：record() 只把消息放进队列，接收循环不会被磁盘阻塞。
+    每个 (symbol, kind) 攒够 block_rows 行、跨小时或超过 flush_interval 秒时写出一个 block。
+    队列最多 max_pending 条消息，磁盘卡住时多出来的消息丢弃并计入 dropped；
+    写盘失败（磁盘满、没有权限）的行计入 lost，线程继续运行，close() 时抛出最后一个错误。
+    """
+
+    def __init__(self, root, block_rows=4096, flush_interval=60.0, max_pending=100000):
+        self.root = root
+        self.block_rows = block_rows
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_pending)
+        self.buffers = {}  # (symbol, kind) -> [hour, rows]
+        self.written = 0
+        self.dropped = 0  # 队列满时丢弃的消息
+        self.lost = 0  # 写盘失败丢掉的行
+        self.error = None
+        self.opened = set()  # 本次运行已经检查过尾部的文件
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def record(self, msg):
+        """msg 为原始字符串或已解析的 dict"""
+        try:
+            self.queue.put_nowait(msg)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.dropped or self.lost:
+            print(
+                f"tick recorder: {self.written} rows written, "
+                f"{self.dropped} messages dropped, {self.lost} rows lost"
+            )
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                msg = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                msg = ""
+            if msg is None:
+                self._flush_all()
+                return
+            if msg:
+                try:
+                    self._add(json.loads(msg) if isinstance(msg, (str, bytes)) else msg)
+                except (KeyError, ValueError) as e:
+                    print(f"skip bad message: {e!r}")
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._flush_all()
+                last_flush = time.monotonic()
+
+    def _add(self, msg):
+        parsed = to_rows(msg)
+        if parsed is None:
+            return
+        symbol, kind, hour, rows = parsed
+        buf = self.buffers.setdefault((symbol, kind), [hour, []])
+        if buf[0] != hour:
+            self._flush(symbol, kind)
+            buf[0] = hour
+        buf[1].extend(rows)
+        if len(buf[1]) >= self.block_rows:
+            self._flush(symbol, kind)
+
+    def _flush(self, symbol, kind):
+        hour, rows = self.buffers[(symbol, kind)]
+        if not rows:
+            return
+        folder = os.path.join(self.root, symbol, kind)
+        name = time.strftime("%Y%m%d-%H", time.gmtime(hour * 3600)) + ".tk"
+        self.buffers[(symbol, kind)][1] = []
+        path = os.path.join(folder, name)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            if path not in self.opened:
+                self._truncate_torn(path, kind)
+                self.opened.add(path)
+            with open(path, "ab") as f:
+                f.write(encode_block(rows, kind))
+        except OSError as e:
+            # 不重试：这批行直接丢掉，缓冲不会越积越多；读取端会忽略写了一半的 block
+            self.lost += len(rows)
+            self.error = e
+            print(
+                f"tick recorder: write {symbol} {kind} failed, {len(rows)} rows lost: {e!r}"
+            )
+            return
+        self.written += len(rows)
+
+    @staticmethod
+    def _truncate_torn(path, kind):
+        """上次运行被杀掉时留下的半个 block 截掉，新的 block 不会接在残留后面"""
+        if not os.path.exists(path):
+            return
+        size, end = os.path.getsize(path), valid_size(path, kind)
+        if end < size:
+            print(f"tick recorder: drop {size - end} torn bytes at the end of {path}")
+            os.truncate(path, end)
+
+    def _flush_all(self):
+        for symbol, kind in list(self.buffers):
+            self._flush(symbol, kind)
+
+
+def _scan_blocks(path, kind):
+    """
+    mmap 读取一个 .tk 文件，逐 block 生成 (结束位置, {列名: ndarray})（差分列未还原）
+    写坏的 block（进程被杀、之后又接着追加）跳过，从下一个 MAGIC 重新同步
+    """
+    schema = SCHEMAS[kind]
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos, size = 0, len(mm)
+        while 0 <= pos and pos + 12 <= size:
+            if mm[pos : pos + 4] != MAGIC:
+                pos = mm.find(MAGIC, pos + 1)
+                continue
+            nrows, ncols = struct.unpack_from("<II", mm, pos + 4)
+            cur, block = pos + 12, {}
+            try:
+                for name, dtype in schema[:ncols]:
+                    if cur + 4 > size:
+                        break
+                    (n,) = struct.unpack_from("<I", mm, cur)
+                    if cur + 4 + n > size:
+                        break
+                    with memoryview(mm)[cur + 4 : cur + 4 + n] as data:
+                        block[name] = np.frombuffer(zlib.decompress(data), dtype)
+                    cur += 4 + n
+            except (zlib.error, ValueError):
+                block = {}
+            if len(block) != len(schema) or any(
+                len(c) != nrows for c in block.values()
+            ):
+                pos = mm.find(MAGIC, pos + 1)
+                continue
+            yield cur, block
+            pos = cur
+
+
+def _iter_blocks(path, kind):
+    for _, block in _scan_blocks(path, kind):
+        yield block
+
+
+def valid_size(path, kind):
+    """文件中最后一个完整 block 的结束位置，之后的字节是写到一半的残留"""
+    end = 0
+    for end, _ in _scan_blocks(path, kind):
+        pass
+    return end
+
+
+def read_file(path, kind):
+    """读取一个 .tk 文件并还原差分列，返回 {列名: ndarray}"""
+    schema = SCHEMAS[kind]
+    blocks = {name: [] for name, _ in schema}
+    for block in _iter_blocks(path, kind):
+        for name, col in block.items():
+            # 差分在每个 block 内从 0 开始，所以按 block 分别 cumsum
+            blocks[name].append(np.cumsum(col) if name in DELTA else col)
+    return {
+        name: np.concatenate(blocks[name]) if blocks[name] else np.empty(0, dtype)
+        for name, dtype in schema
+    }
+
+
+class TickReader:
+    def __init__(self, root):
+        self.root = root
+
+    def files(self, symbol, kind, start=None, end=None):
+        """按小时排序的文件列表，start / end 为 YYYYmmdd-HH 字符串"""
+        folder = os.path.join(self.root, symbol, kind)
+        if not os.path.isdir(folder):
+            return []
+        names = sorted(n for n in os.listdir(folder) if n.endswith(".tk"))
+        return [
+            os.path.join(folder, n)
+            for n in names
+            if (start is None or n[:-3] >= start) and (end is None or n[:-3] <= end)
+        ]
+
+    def load(self, symbol, kind, start=None, end=None):
+        parts = [read_file(path, kind) for path in self.files(symbol, kind, start, end)]
+        schema = SCHEMAS[kind]
+        if not parts:
+            return {name: np.empty(0, dtype) for name, dtype in schema}
+        return {name: np.concatenate([p[name] for p in parts]) for name, _ in schema}
+
+    def klines(self, symbol, start=None, end=None):
+        """已收盘的 K 线，列名与 strategy.GetKlines 一致，可直接传给 Grid(klines=...)"""
+        import pandas as pd
+
+        cols = self.load(symbol, "kline", start, end)
+        closed = cols["x"] == 1
+        df = pd.DataFrame(
+            {
+                "time": cols["t"][closed].astype(float),
+                "open": cols["o"][closed],
+                "high": cols["h"][closed],
+                "low": cols["l"][closed],
+                "close": cols["c"][closed],
+                "amount": cols["v"][closed],
+            }
+        )
+        return df.drop_duplicates("time", keep="last").reset_index(drop=True)
+
+    def messages(self, symbol, kind, start=None, end=None):
+        """还原成币安原始消息（bytes），供 ws_replay 回放"""
+        for path in self.files(symbol, kind, start, end):
+            cols = read_file(path, kind)
+            if kind == "kline":
+                yield from _kline_messages(symbol, cols)
+            else:
+                yield from _depth_messages(symbol, cols)
+
+
+def _kline_messages(symbol, cols):
+    for i in range(len(cols["t"])):
+        yield json.dumps(
+            {
+                "e": "kline",
+                "E": int(cols["E"][i]),
+                "s": symbol,
+                "k": {
+                    "t": int(cols["t"][i]),
+                    "s": symbol,
+                    "o": repr(float(cols["o"][i])),
+                    "h": repr(float(cols["h"][i])),
+                    "l": repr(float(cols["l"][i])),
+                    "c": repr(float(cols["c"][i])),
+                    "v": repr(float(cols["v"][i])),
+                    "x": bool(cols["x"][i]),
+                },
+            }
+        ).encode()
+
+
+def _depth_messages(symbol, cols):
+    u = cols["u"]
+    if not len(u):
+        return
+    # 同一条消息的行是连续的，按 u 变化的位置切分
+    bounds = np.flatnonzero(np.diff(u)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(u)]))
+    side, price, qty = cols["side"], cols["price"], cols["qty"]
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        bids, asks = [], []
+        for i in range(s, e):
+            level = [repr(float(price[i])), repr(float(qty[i]))]
+            if side[i] == 1:
+                bids.append(level)
+            elif side[i] == -1:
+                asks.append(level)
+        yield json.dumps(
+            {
+                "e": "depthUpdate",
+                "E": int(cols["E"][s]),
+                "s": symbol,
+                "U": int(cols["U"][s]),
+                "u": int(u[s]),
+                "b": bids,
+                "a": asks,
+            }
+        ).encode()
+
+
+def backtest(reader, symbol, **kwargs):
+    """用录制的 K 线跑 trading/strategy.py 的 Grid"""
+    trading = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trading")
+    sys.path.insert(0, os.path.normpath(trading))
+    from strategy import Grid
+
+    return Grid(klines=reader.klines(symbol), **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="recorded market data tools")
+    parser.add_argument("command", choices=["info", "replay", "backtest"])
+    parser.add_argument("--root", default="./data/ticks")
+    parser.add_argument("--symbol", default="BNBBTC")
+    parser.add_argument("--kind", default="depth", choices=list(SCHEMAS))
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument("--init", default=None, type=float, help="grid init price")
+    parser.add_argument("--mode", default="intrabar", choices=["bar", "intrabar"])
+    args = parser.parse_args()
+
+    tick_reader = TickReader(args.root)
+    if args.command == "info":
+        for tk in tick_reader.files(args.symbol, args.kind):
+            rows = len(read_file(tk, args.kind)["E"])
+            print(f"{tk} {os.path.getsize(tk) / 1024:.1f}KB rows={rows}")
+    elif args.command == "replay":
+        from ws_replay import serve
+
+        with serve(
+            lambda: tick_reader.messages(args.symbol, args.kind), port=args.port
+        ) as srv:
+            srv.serve_forever()
+    else:
+        res = backtest(tick_reader, args.symbol, init=args.init, mode=args.mode)
+        print(res.attrs["summary"])
@@ -2,37 +2,95 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import multiprocessing
 import os
 import sys
 import math
 import textwrap
+import time
 
-from PIL import Image, ImageFont, ImageDraw, ImageEnhance, ImageChops, ImageOps
+from PIL import Image, ImageFont, ImageDraw, ImageEnhance, ImageChops
 import cv2 as cv
 import numpy as np
 
+from _utils import budget_pixels, iter_files, open_image, peak_rss_mb
 
-def add_mark(image_path, mark, args):
+TILE = 512  # --memory-mb 时分块合成的边长
+
+
+def add_mark(image_path, mark, args, out_dir=None):
     """
-    添加水印，然后保存图片
+    添加水印，然后保存图片到 out_dir（默认 args.out，需已存在），返回是否成功
     """
-    im = Image.open(image_path)
-    im = ImageOps.exif_transpose(im)
+    name = os.path.basename(image_path)
+    try:
+        im = open_image(
+            image_path, args.max_size, budget_pixels(args.memory_mb), args.fit_memory
+        )
+    except ValueError as e:
+        # 超出 --memory-mb 的图片不处理，也不悄悄缩小（除非 --fit-memory）
+        print(f"{name} Failed: {e}", flush=True)
+        return False
 
     image = mark(im)
-    name = os.path.basename(image_path)
     if image:
-        if not os.path.exists(args.out):
-            os.mkdir(args.out)
-
-        new_name = os.path.join(args.out, name)
-        if os.path.splitext(new_name)[1] != ".png":
+        new_name = os.path.join(out_dir or args.out, name)
+        if os.path.splitext(new_name)[1] != ".png" and image.mode != "RGB":
             image = image.convert("RGB")
         image.save(new_name, quality=args.quality)
 
-        print(name + " Success.")
+        print(name + " Success.", flush=True)
+        return True
+    else:
+        print(name + " Failed.", flush=True)
+        return False
+
+
+_worker = {}
+
+
+def _init_worker(args):
+    # 每个进程只生成一次水印函数
+    _worker["args"] = args
+    _worker["mark"] = gen_mark(args, tile=TILE if args.memory_mb else None)
+
+
+def _mark_task(task):
+    image_path, out_dir = task
+    try:
+        return add_mark(image_path, _worker["mark"], _worker["args"], out_dir)
+    except Exception as e:
+        print(f"{image_path} Failed: {e}", flush=True)
+        return False
+
+
+def mark_dir(args):
+    """目录模式：--jobs 个进程并行，边遍历边处理，结束时输出吞吐"""
+    jobs = args.jobs or os.cpu_count()
+    tasks = iter_files(args.file, args.out, (".jpg", ".png"))
+    start = time.perf_counter()
+    pool = None
+    if jobs == 1:
+        _init_worker(args)
+        results = map(_mark_task, tasks)
     else:
-        print(name + " Failed.")
+        pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(args,))
+        results = pool.imap_unordered(_mark_task, tasks, chunksize=4)
+    total = ok = 0
+    try:
+        for success in results:
+            total += 1
+            ok += success
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    cost = time.perf_counter() - start
+    print(
+        f"{ok}/{total} images in {cost:.2f}s, "
+        f"{total / cost if cost else 0:.1f} images/s, jobs={jobs}, "
+        f"peak rss {peak_rss_mb():.0f}MB"
+    )
 
 
 def set_opacity(im, opacity):
@@ -58,9 +116,11 @@ def crop_image(im):
     return im
 
 
-def gen_mark(args):
+def gen_mark(args, cache=True, tile=None):
     """
     生成mark图片，返回添加水印的函数
+    cache 为 False 时每张图片都重新生成水印大图（用于 --bench 对比）
+    tile 不为空时按 tile x tile 分块添加水印（见 _tiled_mark），不生成水印大图
     """
     # 字体宽度、高度
     is_height_crop_float = "." in args.font_height_crop  # not good but work
@@ -88,45 +148,122 @@ def gen_mark(args):
     # 透明度
     set_opacity(mark, args.opacity)
 
+    cell = Image.new(
+        mode="RGBA", size=(mark.size[0] + args.space, mark.size[1] + args.space)
+    )
+    cell.paste(mark, (0, 0))
+    cell = np.asarray(cell)
+    cell_h, cell_w = cell.shape[:2]
+    # 奇数行向左错开半个水印宽度
+    shift = int(cell_w * 0.5)
+
+    def pattern(w, h):
+        """未旋转的 w x h 水印平铺，用 NumPy 平铺代替逐个 paste"""
+        row = np.tile(cell, (1, (w + shift) // cell_w + 2, 1))
+        block = np.concatenate([row[:, :w], row[:, shift : shift + w]])
+        layer = np.tile(block, (-(-h // block.shape[0]), 1, 1))[:h]
+        return Image.fromarray(np.ascontiguousarray(layer), "RGBA")
+
+    def tile_layer(size):
+        """size x size 的旋转水印大图"""
+        return pattern(size, size).rotate(args.angle)
+
+    if tile:
+        return _tiled_mark(pattern, cell_w, cell_h, args.angle, tile)
+
+    layer = None
+
     def mark_im(im):
         """在im图片上添加水印 im为打开的原图"""
+        nonlocal layer
 
         # 计算斜边长度
         c = int(math.sqrt(im.size[0] * im.size[0] + im.size[1] * im.size[1]))
 
-        # 以斜边长度为宽高创建大图（旋转后大图才足以覆盖原图）
-        mark2 = Image.new(mode="RGBA", size=(c, c))
+        # 水印大图只在遇到更大的图片时重建，其余图片从中心裁剪出与原图同样大小的一块
+        if layer is None or layer.size[0] < c or not cache:
+            layer = tile_layer(c)
+        left = (layer.size[0] - im.size[0]) // 2
+        top = (layer.size[1] - im.size[1]) // 2
+        overlay = layer.crop((left, top, left + im.size[0], top + im.size[1]))
 
-        # 在大图上生成水印文字，此处mark为上面生成的水印图片
-        y, idx = 0, 0
-        while y < c:
-            # 制造x坐标错位
-            x = -int((mark.size[0] + args.space) * 0.5 * idx)
-            idx = (idx + 1) % 2
+        if im.mode != "RGBA":
+            im = im.convert("RGBA")
+        return Image.alpha_composite(im, overlay)
 
-            while x < c:
-                # 在该位置粘贴mark水印图片
-                mark2.paste(mark, (x, y))
-                x = x + mark.size[0] + args.space
-            y = y + mark.size[1] + args.space
+    return mark_im
 
-        # 将大图旋转一定角度
-        mark2 = mark2.rotate(args.angle)
 
-        # 在原图上添加大图水印
-        if im.mode != "RGBA":
-            im = im.convert("RGBA")
-        im.paste(
-            mark2,  # 大图
-            (int((im.size[0] - c) / 2), int((im.size[1] - c) / 2)),  # 坐标
-            mask=mark2.split()[3],
-        )
-        del mark2
+def _tiled_mark(pattern, cell_w, cell_h, angle, tile):
+    """
+    分块版本：水印大图是周期为 (cell_w, 2 * cell_h) 的平铺再旋转，
+    每块的水印可以从一张略大于一块的平铺纹理仿射变换得到（与 Image.rotate 相同的 NEAREST 逆映射），
+    平移量对周期取模。原图不整体转成 RGBA，逐条带、逐块合成后贴回，额外内存只和 tile 有关
+    """
+    # 与 Image.rotate 相同的逆映射矩阵
+    rad = -math.radians(angle % 360)
+    a, b = round(math.cos(rad), 15), round(math.sin(rad), 15)
+    d, e = -b, a
+    span_x = int((abs(a) + abs(b)) * tile) + 2
+    span_y = int((abs(d) + abs(e)) * tile) + 2
+    texture = pattern(cell_w + span_x, 2 * cell_h + span_y)
+
+    def mark_im(im):
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+        w, h = im.size
+        c = int(math.sqrt(w * w + h * h))
+        left, top = (c - w) // 2, (c - h) // 2
+        center = c / 2.0
+        c0 = a * -center + b * -center + center
+        f0 = d * -center + e * -center + center
+        for y0 in range(0, h, tile):
+            for x0 in range(0, w, tile):
+                box = (x0, y0, min(x0 + tile, w), min(y0 + tile, h))
+                tx = a * (x0 + left) + b * (y0 + top) + c0
+                ty = d * (x0 + left) + e * (y0 + top) + f0
+                # 平移到纹理范围内：这一块在源图中的最小坐标落到第一个周期里
+                tx -= (
+                    math.floor((tx + min(0, a * tile) + min(0, b * tile)) / cell_w)
+                    * cell_w
+                )
+                ty -= math.floor(
+                    (ty + min(0, d * tile) + min(0, e * tile)) / (2 * cell_h)
+                ) * (2 * cell_h)
+                overlay = texture.transform(
+                    (box[2] - x0, box[3] - y0),
+                    Image.AFFINE,
+                    (a, b, tx, d, e, ty),
+                    Image.NEAREST,
+                )
+                part = Image.alpha_composite(im.crop(box).convert("RGBA"), overlay)
+                im.paste(part if im.mode == "RGBA" else part.convert(im.mode), box)
         return im
 
     return mark_im
 
 
+def bench(args, names):
+    """对目录下的图片分别计时：解码、带缓存加水印、不带缓存加水印"""
+    images = []
+    start = time.perf_counter()
+    for name in names:
+        im = open_image(os.path.join(args.file, name), args.max_size)
+        images.append(im.convert("RGBA"))
+    decode = time.perf_counter() - start
+    print(f"decode {len(images)} images: {decode:.2f}s")
+
+    for cache in (True, False):
+        mark = gen_mark(args, cache=cache)
+        start = time.perf_counter()
+        for im in images:
+            mark(im)
+        cost = time.perf_counter() - start
+        print(
+            f"mark cache={cache}: {cost:.2f}s, {cost / len(images) * 1000:.1f}ms/image"
+        )
+
+
 # python water-marker.py -f ./data/img
 def main():
     parse = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
@@ -205,24 +342,219 @@ def main():
         help="quality of output images, default is 80",
     )
 
+    parse.add_argument(
+        "--max-size",
+        default=None,
+        type=int,
+        help="downscale images to this longest side before marking, JPEG is reduced while decoding",
+    )
+    parse.add_argument(
+        "--memory-mb",
+        default=None,
+        type=int,
+        help=textwrap.dedent(
+            """\
+                       memory budget per worker in MB: watermarks are composited tile by tile
+                       instead of on a full RGBA copy, images are kept at full resolution
+                       and the ones that do not fit are skipped (see --fit-memory)
+                       """
+        ),
+    )
+    parse.add_argument(
+        "--fit-memory",
+        action="store_true",
+        help="downscale images over --memory-mb to fit instead of skipping them",
+    )
+    parse.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="worker processes for directory mode, 0 means cpu count, default is 1",
+    )
+    parse.add_argument(
+        "--annotate",
+        action="store_true",
+        help=textwrap.dedent(
+            """\
+                       draw YOLO label boxes instead of watermarks, for previewing datasets
+                       labels are <image>.txt next to each image unless --labels is given
+                       """
+        ),
+    )
+    parse.add_argument(
+        "--labels",
+        default=None,
+        help="label directory mirroring the -f directory, e.g. dataset/labels",
+    )
+    parse.add_argument(
+        "--names",
+        default=None,
+        help="comma separated class names to print on boxes",
+    )
+    parse.add_argument(
+        "--bench",
+        action="store_true",
+        help="time decoding and marking of the images in -f directory, nothing is saved",
+    )
+
     args = parse.parse_args()
 
     if isinstance(args.mark, str) and sys.version_info[0] < 3:
         args.mark = args.mark.decode("utf-8")
 
-    mark = gen_mark(args)
+    if args.annotate:
+        names = args.names.split(",") if args.names else None
+        if os.path.isdir(args.file):
+            annotate_dir(args.file, args.out, args.labels, args.jobs, names=names)
+        else:
+            os.makedirs(args.out, exist_ok=True)
+            root = os.path.dirname(args.file)
+            txt_url = label_path(args.file, root, args.labels)
+            print(*_annotate_task((args.file, args.out, txt_url, 2, names)))
+        return
+
+    if args.bench:
+        names = [
+            n for n in os.listdir(args.file) if n.lower().endswith((".jpg", ".png"))
+        ]
+        bench(args, names)
+        return
 
     if os.path.isdir(args.file):
-        names = os.listdir(args.file)
-        for name in names:
-            lowercase_filename = name.lower()
-            if lowercase_filename.endswith(".jpg") or lowercase_filename.endswith(
-                ".png"
-            ):
-                image_file = os.path.join(args.file, name)
-                add_mark(image_file, mark, args)
+        mark_dir(args)
     else:
-        add_mark(args.file, mark, args)
+        os.makedirs(args.out, exist_ok=True)
+        add_mark(args.file, gen_mark(args, tile=TILE if args.memory_mb else None), args)
+        print(f"peak rss {peak_rss_mb():.0f}MB")
+
+
+# BGR，按类别循环取色
+PALETTE = np.array(
+    [
+        (0, 255, 0),
+        (0, 0, 255),
+        (255, 0, 0),
+        (0, 255, 255),
+        (255, 0, 255),
+        (255, 255, 0),
+        (0, 128, 255),
+        (255, 0, 128),
+        (128, 255, 0),
+        (128, 0, 255),
+    ],
+    dtype=np.uint8,
+)
+
+
+def load_labels(txt_url):
+    """
+    YOLO 标注文件读成 (n, 5) 数组：label x y w h（归一化的中心点和宽高）
+    列数不是 5 的行（分割多边形等）不是框，跳过并打印警告，文件不存在或为空时返回空数组
+    """
+    if not os.path.exists(txt_url) or os.path.getsize(txt_url) == 0:
+        return np.empty((0, 5))
+    rows, skipped = [], 0
+    with open(txt_url, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 5:
+                rows.append(fields)
+            elif fields:
+                skipped += 1
+    if skipped:
+        print(
+            f"{txt_url}: skipped {skipped} rows that are not 5-field boxes", flush=True
+        )
+    if not rows:
+        return np.empty((0, 5))
+    return np.array(rows, dtype=np.float64)
+
+
+def yolo_to_pixels(labels, width, height):
+    """(n, 5) 归一化标注 -> (n, 4) 像素坐标 x1 y1 x2 y2，整体向量化计算并裁剪到图片范围内"""
+    xy, wh = labels[:, 1:3], labels[:, 3:5] / 2
+    boxes = np.concatenate([xy - wh, xy + wh], axis=1) * (width, height, width, height)
+    upper = (width - 1, height - 1, width - 1, height - 1)
+    return np.clip(boxes, 0, upper).astype(np.int32)
+
+
+def draw_labels(img, labels, thickness=2, names=None):
+    """在 BGR 图片上画出标注框（原地修改），返回框的数量"""
+    if not len(labels):
+        return 0
+    boxes = yolo_to_pixels(labels, img.shape[1], img.shape[0])
+    classes = labels[:, 0].astype(np.int32)
+    colors = PALETTE[classes % len(PALETTE)].tolist()
+    for (x1, y1, x2, y2), cls, color in zip(boxes.tolist(), classes.tolist(), colors):
+        cv.rectangle(img, (x1, y1), (x2, y2), color, thickness)
+        if names is not None:
+            text = names[cls] if cls < len(names) else str(cls)
+            cv.putText(
+                img,
+                text,
+                (x1, max(y1 - 4, 10)),
+                cv.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                color,
+                1,
+                cv.LINE_AA,
+            )
+    return len(boxes)
+
+
+def label_path(image_path, root, labels_root=None):
+    """
+    图片对应的标注文件：默认与图片同名同目录；
+    给出 labels_root 时按相对 root 的路径到 labels_root 下找（images/ 与 labels/ 分开的数据集）
+    """
+    stem = os.path.splitext(image_path)[0]
+    if labels_root:
+        stem = os.path.join(labels_root, os.path.relpath(stem, root))
+    return f"{stem}.txt"
+
+
+def _annotate_task(task):
+    image_path, out_dir, txt_url, thickness, names = task
+    try:
+        img = cv.imdecode(np.fromfile(image_path, dtype=np.uint8), cv.IMREAD_COLOR)
+        if img is None:
+            return image_path, None, "could not read the image"
+        count = draw_labels(img, load_labels(txt_url), thickness, names)
+        ext = os.path.splitext(image_path)[1]
+        ok, buf = cv.imencode(ext, img)
+        if not ok:
+            return image_path, None, f"could not encode {ext}"
+        buf.tofile(os.path.join(out_dir, os.path.basename(image_path)))
+        return image_path, count, None
+    except (OSError, ValueError, cv.error) as e:
+        return image_path, None, repr(e)
+
+
+def annotate_dir(src, out, labels_root=None, jobs=None, thickness=2, names=None):
+    """
+    批量渲染标注预览（无界面）：遍历 src 下的图片，画框后按原目录结构写到 out
+    """
+    cv.setNumThreads(1)  # 并行在进程这一层，避免 OpenCV 线程与进程池互相抢占
+    tasks = (
+        (path, out_dir, label_path(path, src, labels_root), thickness, names)
+        for path, out_dir in iter_files(src, out, (".jpg", ".jpeg", ".png", ".bmp"))
+    )
+    total = failed = boxes = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs or os.cpu_count()) as pool:
+        for path, count, err in pool.imap_unordered(_annotate_task, tasks, chunksize=8):
+            total += 1
+            if err:
+                failed += 1
+                print(f"{path} Failed: {err}", flush=True)
+            else:
+                boxes += count
+    cost = time.perf_counter() - start
+    print(
+        f"{total - failed}/{total} images, {boxes} boxes in {cost:.2f}s, "
+        f"{total / cost if cost else 0:.1f} images/s, peak rss {peak_rss_mb():.0f}MB"
+    )
 
 
 # img_url path to image file
@@ -231,7 +563,7 @@ def img_marker(
 ):
     img = cv.imdecode(np.fromfile(img_url, dtype=np.uint8), -1)
     txt_urls = img_url.rsplit(".", 1)
-    txt_url = "{txt_urls[0]}.txt"
+    txt_url = f"{txt_urls[0]}.txt"
 
     if img is None:
         sys.exit("Could not read the image.")
@@ -243,26 +575,7 @@ def img_marker(
         # 0 0.500781 0.611111 0.023438 0.027778
         # 0 0.534766 0.599306 0.024219 0.034722
         # 1 0.376172 0.729861 0.039844 0.079167
-        with open(txt_url, "r") as f:
-            lines = f.readlines()
-
-        # read annotation by line
-        for line in lines:
-            parts = line.split()
-            label = int(parts[0])
-            x = float(parts[1])
-            y = float(parts[2])
-            w = float(parts[3])
-            h = float(parts[4])
-
-            # calculate the rectangle box
-            x1 = int((x - w / 2) * img.shape[1])
-            y1 = int((y - h / 2) * img.shape[0])
-            x2 = int((x + w / 2) * img.shape[1])
-            y2 = int((y + h / 2) * img.shape[0])
-
-            # draw the rectangle box
-            cv.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        draw_labels(img, load_labels(txt_url))
         cv.imshow("Display window", img)
         k = cv.waitKey(0)
         if k == ord("q"):  # wait for ESC key to exit
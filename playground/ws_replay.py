@@ -0,0 +1,112 @@
+"""
+本地 WebSocket 回放服务：把录制好的行情（每行一条原始消息）按顺序推给客户端，
+用来代替 wss://stream.binance.com 做离线测试，只依赖标准库。
+
+    python ws_replay.py ../data/dydxusdt@kline_1m.jsonl --port 8765
+    python ../trading/live_grid.py --url ws://127.0.0.1:8765 --init 3
+"""
+
+import argparse
+import base64
+import hashlib
+import socket
+import socketserver
+import struct
+import time
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def handshake(rfile, wfile):
+    """完成 HTTP Upgrade 握手，返回请求路径"""
+    request_line = rfile.readline().decode("latin-1").strip()
+    headers = {}
+    while True:
+        line = rfile.readline().decode("latin-1").strip()
+        if not line:
+            break
+        k, _, v = line.partition(":")
+        headers[k.strip().lower()] = v.strip()
+    accept = base64.b64encode(
+        hashlib.sha1(headers["sec-websocket-key"].encode() + GUID).digest()
+    )
+    wfile.write(
+        b"HTTP/1.1 101 Switching Protocols\r\n"
+        b"Upgrade: websocket\r\n"
+        b"Connection: Upgrade\r\n"
+        b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+    )
+    return request_line.split(" ")[1] if " " in request_line else "/"
+
+
+def frame(payload, opcode=0x1):
+    """服务端发出的帧不需要 mask"""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def iter_messages(path):
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def make_handler(messages, interval=0.0, loop=1):
+    """messages 为可重复迭代的消息源（返回 bytes 的可调用对象）"""
+
+    class ReplayHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            handshake(self.rfile, self.wfile)
+            # 客户端的 SUBSCRIBE 等消息留在接收缓冲里，不做处理
+            try:
+                for _ in range(loop):
+                    for msg in messages():
+                        self.wfile.write(frame(msg))
+                        if interval:
+                            time.sleep(interval)
+                self.wfile.write(frame(struct.pack("!H", 1000), opcode=0x8))
+                self.wfile.flush()
+                # 关闭前读完客户端发来的数据，否则内核会回 RST，客户端可能丢掉未读的消息
+                self.request.shutdown(socket.SHUT_WR)
+                while self.request.recv(65536):
+                    pass
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return ReplayHandler
+
+
+class ReplayServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(messages, host="127.0.0.1", port=8765, interval=0.0, loop=1):
+    server = ReplayServer((host, port), make_handler(messages, interval, loop))
+    print(f"replaying on ws://{host}:{server.server_address[1]}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replay recorded websocket messages")
+    parser.add_argument("file", help="recorded stream, one raw message per line")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8765, type=int)
+    parser.add_argument(
+        "--interval", default=0.0, type=float, help="seconds between messages"
+    )
+    parser.add_argument("--loop", default=1, type=int, help="replay the file N times")
+    args = parser.parse_args()
+
+    with serve(
+        lambda: iter_messages(args.file), args.host, args.port, args.interval, args.loop
+    ) as srv:
+        srv.serve_forever()
@@ -2,14 +2,19 @@
 use [backpack-faskety-auto-trade](https://github.com/yuankongzhe/backpack-faskety-auto-trade) directly
 """
 
+import functools
 import os
 from dotenv import load_dotenv
 import requests
+import requests.adapters
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import base64
-from urllib.parse import urlencode
+from urllib.parse import quote_plus
 import ed25519
 import json
+from urllib3.exceptions import NewConnectionError
 
 # AFF: https://backpack.exchange/refer/8c8d0654-10d0-44b9-8457-504507210695
 # https://backpack.exchange/settings/api-keys
@@ -21,101 +26,319 @@ api_secret = os.getenv("API_SECRET")
 api_key = os.getenv("API_KEY")
 # API endpoint
 api_url = "https://api.backpack.exchange/api/v1"
+# the exchange may have accepted these even when the reply was a timeout or a 5xx,
+# so batch() only resends them when the request provably never went out (or on 429)
+NON_IDEMPOTENT = {"orderExecute"}
 
 
-# Function to make a signed API request
-def make_signed_request(
-    api_key, endpoint, instruction, method="GET", params=None, data=None
-):
-    timestamp = int(time.time() * 1000)
-    window = 5000
-
-    headers = {
-        "Content-Type": "application/json; charset=utf-8",
-        "X-Timestamp": str(timestamp),
-        "X-Window": str(window),
-        "X-API-Key": api_key,
-    }
-
-    signing_string = ""
-    if instruction:
-        signing_string += f"instruction={instruction}&"
-
-    if data:
-        signing_string += (
-            urlencode(
-                sorted(
-                    [
-                        (k, str(v).lower() if isinstance(v, bool) else v)
-                        for k, v in data.items()
-                    ]
+def not_sent(error):
+    """Whether a requests error was raised before the request reached the server."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(
+        reason, NewConnectionError
+    )
+
+
+class RateLimiter:
+    """Thread-safe token bucket, acquire() blocks until a token is available."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
                 )
-            )
-            + "&"
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+@functools.lru_cache(maxsize=1024)
+def signing_template(instruction, keys):
+    """
+    Cached prefix and sorted ``key=`` fragments for one instruction / parameter shape,
+    so repeated instructions only quote their values.
+    """
+    prefix = f"instruction={instruction}&" if instruction else ""
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return prefix, tuple((i, quote_plus(str(keys[i])) + "=") for i in order)
+
+
+def signing_prefix(instruction, values, lower_bools):
+    """Same as ``instruction=..&`` + urlencode(sorted(values.items())) + ``&``."""
+    prefix, fields = signing_template(instruction, tuple(values))
+    if not fields:
+        return prefix
+    vals = list(values.values())
+    parts = []
+    for i, field in fields:
+        v = vals[i]
+        if lower_bools and isinstance(v, bool):
+            v = "true" if v else "false"
+        parts.append(field + quote_plus(v if isinstance(v, str) else str(v)))
+    return prefix + "&".join(parts) + "&"
+
+
+class BackpackSigner:
+    """ed25519 request signing and latency bookkeeping shared by the sync and async clients."""
+
+    def __init__(self, api_key, api_secret, window=5000, verbose=False):
+        self.api_key = api_key
+        self.window = window
+        self.verbose = verbose
+        self.signing_key = ed25519.SigningKey(base64.b64decode(api_secret))
+        self.suffix = f"&window={window}"
+        self.lock = threading.Lock()
+        self.stats = {}  # instruction -> [count, total_s, max_s, last_s]
+
+    def signing_string(self, instruction, timestamp, params=None, data=None):
+        if data:
+            prefix = signing_prefix(instruction, data, True)
+        elif params:
+            prefix = signing_prefix(instruction, params, False)
+        else:
+            prefix = signing_prefix(instruction, {}, False)
+        return f"{prefix}timestamp={timestamp}{self.suffix}"
+
+    def sign_headers(self, instruction, params=None, data=None):
+        timestamp = int(time.time() * 1000)
+        signing_string = self.signing_string(instruction, timestamp, params, data)
+        signature = base64.b64encode(self.signing_key.sign(signing_string.encode()))
+        if self.verbose:
+            print("signing_string:", signing_string)
+        return {
+            "X-Timestamp": str(timestamp),
+            "X-Window": str(self.window),
+            "X-Signature": signature.decode(),
+        }
+
+    def _record(self, instruction, elapsed):
+        with self.lock:
+            stat = self.stats.setdefault(instruction, [0, 0.0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] = max(stat[2], elapsed)
+            stat[3] = elapsed
+
+    def metrics(self):
+        """{instruction: {count, mean_ms, max_ms, last_ms}}"""
+        return {
+            instruction: {
+                "count": count,
+                "mean_ms": total / count * 1000,
+                "max_ms": peak * 1000,
+                "last_ms": last * 1000,
+            }
+            for instruction, (count, total, peak, last) in self.stats.items()
+        }
+
+
+class BackpackClient(BackpackSigner):
+    """
+    Signed REST client: the ed25519 key is parsed once and requests go through a
+    keep-alive requests.Session, so bursts of orders skip the TLS handshake and key
+    parsing. Per-instruction latency is collected in ``metrics()``.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        api_secret,
+        base_url=api_url,
+        window=5000,
+        verbose=False,
+        pool_size=10,
+        rate=20,
+        timeout=10,
+    ):
+        super().__init__(api_key, api_secret, window=window, verbose=verbose)
+        self.base_url = base_url
+        self.rate = rate  # default requests per second for batch()
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json; charset=utf-8",
+                "X-API-Key": api_key,
+            }
+        )
+
+    def send(
+        self, endpoint, instruction, method="GET", params=None, data=None, headers=None
+    ):
+        """Send one request and return the Response; headers may be pre-signed (see sign_headers)."""
+        if headers is None:
+            headers = self.sign_headers(instruction, params, data)
+        if self.verbose:
+            print("headers:", headers, params, json.dumps(data))
+
+        start = time.perf_counter()
+        response = self.session.request(
+            method,
+            self.base_url + endpoint,
+            headers=headers,
+            params=params,
+            json=data if method != "GET" else None,
+            timeout=self.timeout,
         )
-    elif params:
-        signing_string += urlencode(sorted(params.items())) + "&"
+        self._record(instruction, time.perf_counter() - start)
 
-    signing_string += f"timestamp={timestamp}&window={window}"
+        if self.verbose:
+            print(
+                "response url:",
+                response.url,
+                response.status_code,
+                response.text,
+                response.reason,
+            )
+        return response
 
-    print("signing_string:", signing_string)
+    def request(self, endpoint, instruction, method="GET", params=None, data=None):
+        return self.send(endpoint, instruction, method, params, data).json()
 
-    private_key = base64.b64decode(api_secret)
-    ed25519_private_key = ed25519.SigningKey(private_key)
-    signature = base64.b64encode(ed25519_private_key.sign(signing_string.encode()))
-    headers["X-Signature"] = signature
+    def batch(self, jobs, max_workers=8, rate=None, retries=3, backoff=0.2):
+        """
+        Run signed requests concurrently, jobs being (endpoint, instruction, method, data).
+        Everything is signed up front and sent at most ``rate`` requests per second.
+        Connection errors, timeouts, 429 and 5xx are retried with exponential backoff
+        and a fresh signature. NON_IDEMPOTENT instructions (orderExecute) are only
+        retried on 429 and on errors raised before sending; after a read timeout, a
+        dropped connection or a 5xx they are marked ``"uncertain": True`` instead,
+        as the order may exist. Returns one result dict per job, in order.
+        """
+        limiter = RateLimiter(rate or self.rate)
+        signed = [
+            (time.monotonic(), self.sign_headers(instruction, data=data))
+            for _, instruction, _, data in jobs
+        ]
 
-    print("headers:", headers, params, data, json.dumps(data))
+        def run(i):
+            endpoint, instruction, method, data = jobs[i]
+            signed_at, headers = signed[i]
+            result = {"job": jobs[i], "ok": False, "status": None, "attempts": 0}
+            safe = instruction not in NON_IDEMPOTENT
+            for attempt in range(retries + 1):
+                if attempt:
+                    time.sleep(backoff * 2 ** (attempt - 1))
+                # a signature is only valid for `window` ms, re-sign stale ones
+                if attempt or time.monotonic() - signed_at > self.window / 2000:
+                    headers = self.sign_headers(instruction, data=data)
+                limiter.acquire()
+                result["attempts"] = attempt + 1
+                try:
+                    response = self.send(
+                        endpoint, instruction, method, data=data, headers=headers
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    result["error"] = repr(e)
+                    if safe or not_sent(e):
+                        continue
+                    result["uncertain"] = True
+                    break
+                result["status"] = response.status_code
+                try:
+                    result["result"] = response.json()
+                except ValueError:
+                    result["result"] = response.text
+                if response.status_code == 429 or (
+                    safe and response.status_code >= 500
+                ):
+                    continue
+                if response.status_code >= 500:
+                    result["uncertain"] = True
+                result["ok"] = response.ok
+                result.pop("error", None)
+                break
+            return result
 
-    if method == "GET":
-        response = requests.get(api_url + endpoint, headers=headers, params=params)
-    elif method == "POST":
-        response = requests.post(
-            api_url + endpoint, headers=headers, params=params, json=data
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(run, range(len(jobs))))
+
+    def place_orders(self, orders, **kwargs):
+        """orders is a list of orderExecute bodies"""
+        return self.batch(
+            [("/order", "orderExecute", "POST", o) for o in orders], **kwargs
         )
-    elif method == "DELETE":
-        response = requests.delete(
-            api_url + endpoint, headers=headers, params=params, json=data
+
+    def cancel_orders(self, symbol, order_ids, **kwargs):
+        jobs = [
+            ("/order", "orderCancel", "DELETE", {"orderId": oid, "symbol": symbol})
+            for oid in order_ids
+        ]
+        return self.batch(jobs, **kwargs)
+
+    def cancel_all(self, symbol):
+        """Cancel every open order on symbol in one request."""
+        return self.request(
+            "/orders", "orderCancelAll", "DELETE", data={"symbol": symbol}
         )
 
-    print(
-        "response url:",
-        response.url,
-        response.status_code,
-        response.text,
-        response.reason,
+    def close(self):
+        self.session.close()
+
+
+_client = None
+
+
+# Function to make a signed API request
+def make_signed_request(
+    api_key, endpoint, instruction, method="GET", params=None, data=None
+):
+    global _client
+    if _client is None or _client.api_key != api_key:
+        _client = BackpackClient(api_key, api_secret, verbose=True)
+    return _client.request(
+        endpoint, instruction, method=method, params=params, data=data
     )
 
-    return response.json()
-
-
-# Example usage for canceling an order
-endpoint = "/capital"
-instruction = "balanceQuery"
-request_method = "GET"
-body = None
-
-# endpoint = "/order"
-# instruction = "orderCancel"
-# body = {
-#     "orderId": 111948065686028288,
-#     "symbol": "SOL_USDC",
-# }
-# request_method = "DELETE"
-
-# endpoint = "/order"
-# instruction = "orderExecute"
-# body = {
-#     "symbol": "SOL_USDC",
-#     "side": "Ask",
-#     "orderType": "Limit",
-#     "quantity": "1.00",
-#     "price": "211.61",
-#     "postOnly": False,
-# }
-# request_method = "POST"
-
-response = make_signed_request(
-    api_key, endpoint, instruction, method=request_method, data=body
-)
-print(response)
+
+if __name__ == "__main__":
+    # Example usage for canceling an order
+    endpoint = "/capital"
+    instruction = "balanceQuery"
+    request_method = "GET"
+    body = None
+
+    # endpoint = "/order"
+    # instruction = "orderCancel"
+    # body = {
+    #     "orderId": 111948065686028288,
+    #     "symbol": "SOL_USDC",
+    # }
+    # request_method = "DELETE"
+
+    # endpoint = "/order"
+    # instruction = "orderExecute"
+    # body = {
+    #     "symbol": "SOL_USDC",
+    #     "side": "Ask",
+    #     "orderType": "Limit",
+    #     "quantity": "1.00",
+    #     "price": "211.61",
+    #     "postOnly": False,
+    # }
+    # request_method = "POST"
+
+    response = make_signed_request(
+        api_key, endpoint, instruction, method=request_method, data=body
+    )
+    print(response)
+    print(_client.metrics())
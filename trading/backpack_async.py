@@ -0,0 +1,158 @@
+"""
+asyncio variant of BackpackClient on aiohttp, for market-making loops that need many
+requests in flight from one event loop. Signing is shared with backpack.py (same
+signing strings, cached per instruction / parameter shape).
+
+    python backpack_async.py --orders 200   # against the local backpack_stub.py
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+
+# should install aiohttp
+import aiohttp
+
+from backpack import BackpackSigner, api_url
+
+
+class AsyncBackpackClient(BackpackSigner):
+    """
+    One keep-alive aiohttp session per client; ``limit`` bounds the connections and
+    therefore the requests in flight. Use as ``async with AsyncBackpackClient(...)``.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        api_secret,
+        base_url=api_url,
+        window=5000,
+        verbose=False,
+        limit=100,
+        timeout=10,
+    ):
+        super().__init__(api_key, api_secret, window=window, verbose=verbose)
+        self.base_url = base_url
+        self.limit = limit
+        self.timeout = timeout
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300),
+                headers={
+                    "Content-Type": "application/json; charset=utf-8",
+                    "X-API-Key": self.api_key,
+                },
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                json_serialize=json.dumps,
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(
+        self, endpoint, instruction, method="GET", params=None, data=None
+    ):
+        """Signed request, returns (status, json)."""
+        await self.open()
+        headers = self.sign_headers(instruction, params, data)
+        start = time.perf_counter()
+        async with self.session.request(
+            method,
+            self.base_url + endpoint,
+            headers=headers,
+            params=params,
+            json=data if method != "GET" else None,
+        ) as response:
+            payload = await response.json(content_type=None)
+        self._record(instruction, time.perf_counter() - start)
+        if self.verbose:
+            print("response:", method, endpoint, response.status, payload)
+        return response.status, payload
+
+    async def gather(self, jobs):
+        """Run (endpoint, instruction, method, data) jobs concurrently; exceptions are returned."""
+        return await asyncio.gather(
+            *(
+                self.request(endpoint, instruction, method, data=data)
+                for endpoint, instruction, method, data in jobs
+            ),
+            return_exceptions=True,
+        )
+
+    async def place_orders(self, orders):
+        return await self.gather(
+            [("/order", "orderExecute", "POST", o) for o in orders]
+        )
+
+    async def cancel_all(self, symbol):
+        return await self.request(
+            "/orders", "orderCancelAll", "DELETE", data={"symbol": symbol}
+        )
+
+
+async def bench(orders, limit):
+    import ed25519
+    from backpack import BackpackClient, signing_template
+    from backpack_stub import StubExchange, serve
+
+    signing_key, verifying_key = ed25519.create_keypair()
+    secret = base64.b64encode(signing_key.to_seed()).decode()
+    httpd = serve(StubExchange("stub-key", verifying_key))
+    base_url = "http://127.0.0.1:%d/api/v1" % httpd.server_address[1]
+    grid = [
+        {
+            "symbol": "SOL_USDC",
+            "side": "Bid" if i % 2 else "Ask",
+            "orderType": "Limit",
+            "quantity": "0.10",
+            "price": "%.2f" % (200 + (i - orders / 2) * 0.5),
+            "postOnly": True,
+        }
+        for i in range(orders)
+    ]
+
+    sync_client = BackpackClient("stub-key", secret, base_url=base_url)
+    start = time.perf_counter()
+    for order in grid:
+        sync_client.request("/order", "orderExecute", "POST", data=order)
+    sync_cost = time.perf_counter() - start
+    sync_client.close()
+
+    async with AsyncBackpackClient(
+        "stub-key", secret, base_url=base_url, limit=limit
+    ) as client:
+        start = time.perf_counter()
+        results = await client.place_orders(grid)
+        async_cost = time.perf_counter() - start
+        ok = sum(1 for r in results if not isinstance(r, Exception) and r[0] == 200)
+        status, cancelled = await client.cancel_all("SOL_USDC")
+        print(client.metrics())
+    httpd.shutdown()
+
+    print(f"sequential sync: {orders} orders in {sync_cost:.2f}s")
+    print(f"async gather:    {ok}/{orders} ok in {async_cost:.2f}s, limit={limit}")
+    print(f"cancel all: {status} {len(cancelled)} orders")
+    print("signing templates:", signing_template.cache_info())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="async client against the local stub")
+    parser.add_argument("--orders", default=200, type=int)
+    parser.add_argument("--limit", default=50, type=int, help="max connections")
+    args = parser.parse_args()
+    asyncio.run(bench(args.orders, args.limit))
@@ -0,0 +1,189 @@
+"""
+Local stand-in for the Backpack REST API, for exercising BackpackClient without
+touching the exchange. Every request's ed25519 signature and timestamp window is
+checked; orders are kept in memory. It can reject requests over a rate limit (429)
+and fail a share of requests with 503 to exercise retries.
+
+    python backpack_stub.py --orders 50 --fail 0.1
+"""
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import ed25519
+
+INSTRUCTIONS = {
+    ("GET", "/api/v1/capital"): "balanceQuery",
+    ("GET", "/api/v1/orders"): "orderQueryAll",
+    ("POST", "/api/v1/order"): "orderExecute",
+    ("DELETE", "/api/v1/order"): "orderCancel",
+    ("DELETE", "/api/v1/orders"): "orderCancelAll",
+}
+
+
+def expected_signing_string(instruction, params, timestamp, window):
+    items = sorted(
+        (k, str(v).lower() if isinstance(v, bool) else v) for k, v in params.items()
+    )
+    prefix = f"instruction={instruction}&"
+    if items:
+        prefix += urlencode(items) + "&"
+    return prefix + f"timestamp={timestamp}&window={window}"
+
+
+class StubExchange:
+    def __init__(self, api_key, verifying_key, rate=None, fail=0.0):
+        self.api_key = api_key
+        self.verifying_key = verifying_key
+        self.rate = rate
+        self.fail = fail
+        self.orders = {}
+        self.next_id = 1
+        self.hits = []  # request times within the last second, for the rate limit
+        self.lock = threading.Lock()
+        self.rejected = {"signature": 0, "rate": 0, "fail": 0}
+
+    def handle(self, method, path, query, body, headers):
+        """returns (status, payload)"""
+        instruction = INSTRUCTIONS.get((method, path))
+        if instruction is None:
+            return 404, {"code": "NOT_FOUND"}
+
+        params = body if body else query
+        try:
+            timestamp = int(headers["X-Timestamp"])
+            window = int(headers["X-Window"])
+            signature = base64.b64decode(headers["X-Signature"])
+            assert headers["X-API-Key"] == self.api_key
+            assert abs(time.time() * 1000 - timestamp) <= window
+            self.verifying_key.verify(
+                signature,
+                expected_signing_string(
+                    instruction, params, timestamp, window
+                ).encode(),
+            )
+        except (KeyError, ValueError, AssertionError, ed25519.BadSignatureError):
+            with self.lock:
+                self.rejected["signature"] += 1
+            return 401, {"code": "INVALID_SIGNATURE"}
+
+        with self.lock:
+            now = time.monotonic()
+            self.hits = [t for t in self.hits if now - t < 1] + [now]
+            if self.rate and len(self.hits) > self.rate:
+                self.rejected["rate"] += 1
+                return 429, {"code": "TOO_MANY_REQUESTS"}
+            if random.random() < self.fail:
+                self.rejected["fail"] += 1
+                return 503, {"code": "SERVICE_UNAVAILABLE"}
+            return self._execute(instruction, params)
+
+    def _execute(self, instruction, params):
+        if instruction == "balanceQuery":
+            return 200, {"USDC": {"available": "1000", "locked": "0", "staked": "0"}}
+        if instruction == "orderQueryAll":
+            return 200, list(self.orders.values())
+        if instruction == "orderExecute":
+            order = dict(params, id=str(self.next_id), status="New")
+            self.orders[order["id"]] = order
+            self.next_id += 1
+            return 200, order
+        if instruction == "orderCancel":
+            order = self.orders.pop(str(params.get("orderId")), None)
+            if order is None:
+                return 404, {"code": "RESOURCE_NOT_FOUND"}
+            return 200, dict(order, status="Cancelled")
+        cancelled = [o for o in self.orders.values() if o["symbol"] == params["symbol"]]
+        for o in cancelled:
+            del self.orders[o["id"]]
+        return 200, [dict(o, status="Cancelled") for o in cancelled]
+
+
+def serve(exchange, host="127.0.0.1", port=0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+        disable_nagle_algorithm = True
+
+        def _dispatch(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            body = json.loads(raw) if raw else None
+            status, payload = exchange.handle(
+                self.command, url.path, dict(parse_qsl(url.query)), body, self.headers
+            )
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_DELETE = _dispatch
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    from backpack import BackpackClient
+
+    parser = argparse.ArgumentParser(description="batch orders against a local stub")
+    parser.add_argument("--orders", default=50, type=int)
+    parser.add_argument(
+        "--rate", default=20, type=int, help="client requests per second"
+    )
+    parser.add_argument("--server-rate", default=None, type=int, help="stub 429 limit")
+    parser.add_argument("--fail", default=0.1, type=float, help="share of 503 replies")
+    args = parser.parse_args()
+
+    signing_key, verifying_key = ed25519.create_keypair()
+    stub = StubExchange(
+        "stub-key", verifying_key, rate=args.server_rate, fail=args.fail
+    )
+    httpd = serve(stub)
+    client = BackpackClient(
+        "stub-key",
+        base64.b64encode(signing_key.to_seed()).decode(),
+        base_url="http://127.0.0.1:%d/api/v1" % httpd.server_address[1],
+        rate=args.rate,
+    )
+
+    grid = [
+        {
+            "symbol": "SOL_USDC",
+            "side": "Bid" if i % 2 else "Ask",
+            "orderType": "Limit",
+            "quantity": "0.10",
+            "price": "%.2f" % (200 + (i - args.orders / 2) * 0.5),
+            "postOnly": True,
+        }
+        for i in range(args.orders)
+    ]
+    start = time.perf_counter()
+    results = client.place_orders(grid)
+    cost = time.perf_counter() - start
+    placed = [r["result"]["id"] for r in results if r["ok"]]
+    print(
+        f"placed {len(placed)}/{len(grid)} in {cost:.2f}s, "
+        f"retries {sum(r['attempts'] - 1 for r in results)}, rejected {stub.rejected}"
+    )
+
+    half = len(placed) // 2
+    cancelled = client.cancel_orders("SOL_USDC", placed[:half])
+    print(f"cancelled {sum(r['ok'] for r in cancelled)}/{half} one by one")
+    stub.fail = 0
+    print(f"cancel all: {len(client.cancel_all('SOL_USDC'))} orders")
+    print(client.metrics())
+    httpd.shutdown()
@@ -0,0 +1,198 @@
+"""
+实盘 / 模拟盘网格：订阅币安 kline websocket，逐条消息驱动 strategy.py 里的同一套网格逻辑。
+
+每条消息只更新常数大小的状态（网格库存 x、当前 K 线的最高最低价、Recorder 的统计量、
+延迟直方图），可以长时间运行。测试时用 playground/ws_replay.py 回放录制的行情：
+
+    python live_grid.py --stream dydxusdt@kline_1m --init 3 --record ../data/dydx.jsonl
+    python ../playground/ws_replay.py ../data/dydx.jsonl --port 8765
+    python live_grid.py --url ws://127.0.0.1:8765 --init 3
+"""
+
+import argparse
+import json
+import time
+
+# should install websocket-client
+import websocket
+
+from strategy import Exchange, Recorder, intrabar_fills
+
+
+class LatencyStats:
+    """按 2 的幂分桶的延迟直方图，单次记录 O(1)，单位纳秒"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = [0] * 64
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        self.buckets[ns.bit_length()] += 1
+
+    def percentile(self, q):
+        """返回所在分桶的上界"""
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return 1 << i
+        return 0
+
+    def summary(self):
+        if not self.count:
+            return "no messages"
+        return "n=%d mean=%.1fus p50<%.1fus p99<%.1fus max=%.1fus" % (
+            self.count,
+            self.total / self.count / 1000,
+            self.percentile(0.5) / 1000,
+            self.percentile(0.99) / 1000,
+            self.max / 1000,
+        )
+
+
+class LiveGrid:
+    """
+    增量网格：每条 kline 更新都把上一价格到最新价格之间穿过的网格全部成交，
+    K 线收盘时把账户记到 Recorder。
+    """
+
+    def __init__(
+        self,
+        symbol,
+        value=100,
+        pct=0.01,
+        init=None,
+        fee=0.0002,
+        initial_balance=10000,
+        verbose=True,
+    ):
+        self.symbol = symbol
+        self.value = value
+        self.pct = pct
+        self.init = init
+        self.exchange = Exchange([symbol], fee=fee, initial_balance=initial_balance)
+        self.recorder = Recorder(None, initial_balance=initial_balance)
+        self.latency = LatencyStats()
+        self.verbose = verbose
+        self.x = None  # 网格库存 value / pct / init_price + amount
+        self.price = None  # 最近一次成交价
+        self.bar = None  # 当前 K 线开始时间
+        self.high = self.low = None
+        self.traded = 0  # 当前 K 线成交额
+
+    def on_kline(self, k):
+        """处理一条 kline 事件中的 k 字段，返回本次成交 [(direction, price, amount)]"""
+        o, h, l, c = float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"])
+        if self.x is None:
+            init_price = o if self.init is None else self.init
+            self.x = self.value / self.pct / init_price
+            self.price = o
+        if k["t"] != self.bar:
+            self.bar = k["t"]
+            self.high = self.low = o
+            self.traded = 0
+
+        # 两次推送之间只知道是否刷新了最高 / 最低价，没刷新就当作直接走到收盘价
+        last = self.price
+        hi = h if h > self.high else max(last, c)
+        lo = l if l < self.low else min(last, c)
+        fills, self.x = intrabar_fills(self.x, last, hi, lo, c, self.value, self.pct)
+        for direction, price, amount in fills:
+            self.exchange.Trade(self.symbol, direction, price, amount)
+            self.traded += price * amount
+        self.high, self.low, self.price = max(self.high, h), min(self.low, l), c
+
+        if k["x"]:  # K 线收盘
+            e = self.exchange
+            e.Update({self.symbol: c})
+            self.recorder.update(
+                k["t"],
+                c,
+                e.account[self.symbol]["amount"],
+                e.account["USDT"]["total"] - e.initial_balance,
+                e.account["USDT"]["fee"],
+                self.traded,
+            )
+        return fills
+
+    def on_message(self, _, message):
+        start = time.perf_counter_ns()
+        msg = json.loads(message)
+        data = msg.get("data", msg)  # 组合流 /stream?streams= 会多包一层
+        fills = None
+        if data.get("e") == "kline":
+            fills = self.on_kline(data["k"])
+        self.latency.add(time.perf_counter_ns() - start)
+
+        if self.verbose and fills:
+            for direction, price, amount in fills:
+                print(
+                    "BUY " if direction == 1 else "SELL",
+                    round(price, 6),
+                    round(amount, 6),
+                )
+
+    def report(self):
+        print("position:", self.exchange.account[self.symbol])
+        print("account:", self.exchange.account["USDT"])
+        print("summary:", self.recorder.summary())
+        print("decision latency:", self.latency.summary())
+
+
+def run(args):
+    grid = LiveGrid(
+        args.symbol,
+        value=args.value,
+        pct=args.pct,
+        init=args.init,
+        verbose=not args.quiet,
+    )
+    record = open(args.record, "a") if args.record else None
+
+    def on_message(ws_ins, message):
+        if record:
+            record.write(message if message.endswith("\n") else message + "\n")
+        grid.on_message(ws_ins, message)
+
+    def on_open(ws_ins):
+        print("WebSocket opened")
+        subscribe_msg = {"method": "SUBSCRIBE", "params": [args.stream], "id": 1}
+        ws_ins.send(json.dumps(subscribe_msg))
+
+    ws = websocket.WebSocketApp(
+        args.url,
+        on_open=on_open,
+        on_message=on_message,
+        on_error=lambda _, error: print(error),
+        on_close=lambda *_: print("WebSocket closed"),
+    )
+    try:
+        ws.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if record:
+            record.close()
+        grid.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="paper trade the grid on live klines")
+    parser.add_argument("--url", default="wss://stream.binance.com:9443/ws")
+    parser.add_argument("--stream", default="dydxusdt@kline_1m")
+    parser.add_argument("--symbol", default="DYDX")
+    parser.add_argument("--value", default=100, type=float)
+    parser.add_argument("--pct", default=0.01, type=float)
+    parser.add_argument(
+        "--init", default=None, type=float, help="grid init price, default first open"
+    )
+    parser.add_argument("--record", default=None, help="append raw messages to file")
+    parser.add_argument("--quiet", action="store_true", help="don't print fills")
+    run(parser.parse_args())
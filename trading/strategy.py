@@ -1,6 +1,8 @@
 import requests
 from datetime import datetime
+import math
 import time
+import numpy as np
 import pandas as pd
 import requests
 
@@ -43,8 +45,13 @@ def GetKlines(symbol="BTC", start="2020-8-10", end="2021-8-10", period="1h"):
     ).astype("float")
 
 
-df = GetKlines(symbol="DYDX", start="2022-1-1", end="2023-12-7", period="5m")
-df = df.drop_duplicates()
+def load_klines():
+    return GetKlines(
+        symbol="DYDX", start="2022-1-1", end="2023-12-7", period="5m"
+    ).drop_duplicates()
+
+
+df = None  # backtest klines, loaded in __main__ (or pass klines= to Grid)
 
 
 class Exchange:
@@ -138,16 +145,182 @@ class Exchange:
         )
 
 
+class Recorder:
+    """
+    Backtest results written into preallocated float64 columns.
+
+    Every ``every``-th bar is kept, or only bars with trades when ``on_trade`` is set;
+    the last bar is always kept. Max drawdown, Sharpe and turnover are updated on
+    every bar, recorded or not. With ``size=None`` no rows are stored at all.
+    """
+
+    columns = ("time", "price", "amount", "profit", "fee")
+
+    def __init__(
+        self,
+        size,
+        initial_balance=10000,
+        every=1,
+        on_trade=False,
+        periods_per_year=1,
+    ):
+        self.size = size or 0
+        self.every = max(int(every), 1)
+        self.on_trade = on_trade
+        if not size:  # statistics only, e.g. for live runs of unknown length
+            capacity = 0
+        elif on_trade:
+            capacity = size
+        else:
+            capacity = min(size, -(-size // self.every) + 1)
+        self.capacity = capacity
+        self.data = {col: np.empty(capacity) for col in self.columns}
+        self.rows = 0
+        self.bars = 0
+        self.initial_balance = initial_balance
+        self.periods_per_year = periods_per_year
+        self.equity = self.peak = initial_balance
+        self.max_drawdown = 0.0
+        self.turnover = 0.0
+        self._mean = self._m2 = 0.0  # Welford running mean / variance of bar returns
+
+    def update(self, time, price, amount, profit, fee, traded=0):
+        bar = self.bars
+        self.bars = bar + 1
+
+        equity = self.initial_balance + profit
+        ret = equity / self.equity - 1 if self.equity else 0.0
+        self.equity = equity
+        delta = ret - self._mean
+        self._mean += delta / self.bars
+        self._m2 += delta * (ret - self._mean)
+        if equity > self.peak:
+            self.peak = equity
+        elif self.peak > 0 and 1 - equity / self.peak > self.max_drawdown:
+            self.max_drawdown = 1 - equity / self.peak
+        self.turnover += traded
+
+        if self.on_trade:
+            keep = traded > 0
+        else:
+            keep = bar % self.every == 0
+        if (keep or bar == self.size - 1) and self.rows < self.capacity:
+            row, data = self.rows, self.data
+            data["time"][row] = time
+            data["price"][row] = price
+            data["amount"][row] = amount
+            data["profit"][row] = profit
+            data["fee"][row] = fee
+            self.rows = row + 1
+
+    def summary(self):
+        std = math.sqrt(self._m2 / (self.bars - 1)) if self.bars > 1 else 0.0
+        return {
+            "bars": self.bars,
+            "profit": self.equity - self.initial_balance,
+            "max_drawdown": self.max_drawdown,
+            "sharpe": self._mean / std * math.sqrt(self.periods_per_year)
+            if std
+            else 0.0,
+            "turnover": self.turnover / self.initial_balance,
+        }
+
+    def frame(self):
+        res = pd.DataFrame({col: arr[: self.rows] for col, arr in self.data.items()})
+        res.index = pd.to_datetime(res.time, unit="ms")
+        return res
+
+
 symbol = "DYDX"
 value = 100
 pct = 0.01
 
 
-def Grid(fee=0.0002, value=100, pct=0.01, init=df.close[0]):
+def intrabar_fills(x, open_price, high, low, close, value=100, pct=0.01):
+    """
+    Every grid level crossed inside one kline, batched per price leg.
+
+    x is the grid inventory ``value / pct / init_price + amount``; the buy level is
+    ``(value / pct - value) / x`` and the sell level ``(value / pct + value) / x``.
+    Up bars are walked open->low->high->close and down bars open->high->low->close.
+    All levels crossed on a leg are filled as one order at their average price.
+    Returns ``(fills, x)`` where fills is a list of ``(direction, price, amount)``.
+    """
+    size = value / pct
+    if close >= open_price:
+        path = ((low, 1), (high, -1), (close, 1))
+    else:
+        path = ((high, -1), (low, 1), (close, -1))
+    fills = []
+    for target, direction in path:
+        if direction == 1:
+            level = (size - value) / x
+            if target >= level:
+                continue
+            # each buy moves the level down by (1 - pct)
+            n = math.ceil(math.log(target / level) / math.log(1 - pct))
+            new_x = x * (size / (size - value)) ** n
+            amount = new_x - x
+        else:
+            level = (size + value) / x
+            if target <= level:
+                continue
+            # each sell moves the level up by (1 + pct)
+            n = math.ceil(math.log(target / level) / math.log(1 + pct))
+            new_x = x * (size / (size + value)) ** n
+            amount = x - new_x
+        fills.append((direction, n * value / amount, amount))
+        x = new_x
+    return fills, x
+
+
+def Grid(
+    fee=0.0002,
+    value=100,
+    pct=0.01,
+    init=None,
+    mode="bar",
+    every=1,
+    on_trade=False,
+    klines=None,
+):
+    """
+    mode "bar" fills at most one buy and one sell per kline, "intrabar" fills every
+    grid level the kline crossed (see intrabar_fills).
+    every / on_trade thin the recorded rows (see Recorder), the summary statistics
+    are kept in ``res.attrs["summary"]``.
+    klines defaults to the module level df, init to its first close.
+    """
+    if klines is None:
+        klines = df
     e = Exchange([symbol], fee=0.0002, initial_balance=10000)
-    init_price = init
-    res_list = []  # For storing intermediate results
-    for row in df.iterrows():
+    init_price = klines.close[0] if init is None else init
+    times = klines.time.to_numpy(dtype=float)
+    bar_ms = times[1] - times[0] if len(times) > 1 else 0
+    recorder = Recorder(
+        len(klines),
+        initial_balance=e.initial_balance,
+        every=every,
+        on_trade=on_trade,
+        periods_per_year=365 * 24 * 3600 * 1000 / bar_ms if bar_ms > 0 else 1,
+    )
+    if mode == "intrabar":
+        _grid_intrabar(klines, e, recorder, value, pct, init_price)
+    else:
+        _grid_bar(klines, e, recorder, value, pct, init_price)
+    print(
+        "Final profit:",
+        e.account["USDT"]["total"] - e.initial_balance,
+        "Handling fee:",
+        e.account["USDT"]["fee"],
+    )
+    res = recorder.frame()
+    res.attrs["summary"] = recorder.summary()
+    return res
+
+
+def _grid_bar(klines, e, recorder, value, pct, init_price):
+    for row in klines.iterrows():
         kline = row[
             1
         ]  # To backtest a K-line will only generate one buy order or one sell order, which is not particularly accurate.
@@ -157,36 +330,55 @@ def Grid(fee=0.0002, value=100, pct=0.01, init=df.close[0]):
         sell_price = (value / pct + value) / (
             (value / pct) / init_price + e.account[symbol]["amount"]
         )
+        traded = 0
         if (
             kline.low < buy_price
         ):  # The lowest price of the K-line is lower than the current pending order price, the buy order is filled
             e.Buy(symbol, buy_price, value / buy_price)
+            traded += value
         if kline.high > sell_price:
             e.Sell(symbol, sell_price, value / sell_price)
+            traded += value
         e.Update({symbol: kline.close})
-        res_list.append(
-            [
-                kline.time,
-                kline.close,
-                e.account[symbol]["amount"],
-                e.account["USDT"]["total"] - e.initial_balance,
-                e.account["USDT"]["fee"],
-            ]
+        recorder.update(
+            kline.time,
+            kline.close,
+            e.account[symbol]["amount"],
+            e.account["USDT"]["total"] - e.initial_balance,
+            e.account["USDT"]["fee"],
+            traded,
         )
-    print(
-        "Final profit:",
-        e.account["USDT"]["total"] - e.initial_balance,
-        "Handling fee:",
-        e.account["USDT"]["fee"],
-    )
-    res = pd.DataFrame(
-        data=res_list, columns=["time", "price", "amount", "profit", "fee"]
+
+
+def _grid_intrabar(klines, e, recorder, value, pct, init_price):
+    # Plain float columns instead of iterrows keep a 200k-bar run well under a second.
+    times, opens, highs, lows, closes = (
+        klines[col].to_numpy(dtype=float).tolist()
+        for col in ("time", "open", "high", "low", "close")
     )
-    res.index = pd.to_datetime(res.time, unit="ms")
-    return res
+    account, usdt = e.account[symbol], e.account["USDT"]
+    x = value / pct / init_price + account["amount"]
+    for t, o, h, l, c in zip(times, opens, highs, lows, closes):
+        fills, x = intrabar_fills(x, o, h, l, c, value, pct)
+        traded = 0
+        for direction, price, amount in fills:
+            e.Trade(symbol, direction, price, amount)
+            traded += price * amount
+        amount = account["amount"]
+        recorder.update(
+            t,
+            c,
+            amount,
+            usdt["realised_profit"] + (c - account["hold_price"]) * amount,
+            usdt["fee"],
+            traded,
+        )
+    if closes:
+        e.Update({symbol: closes[-1]})
 
 
 if __name__ == "__main__":
+    df = load_klines()
     for p in [0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05]:
         res = Grid(fee=0.0002, value=value * p / 0.01, pct=p, init=3)
         print(